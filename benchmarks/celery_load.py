@@ -0,0 +1,258 @@
+"""
+Task throughput and end-to-end latency of the Celery workers under a mixed load,
+against a running stack seeded with `manage.py seed_load`.
+
+    python benchmarks/celery_load.py --duration 60 --rate 40
+    python benchmarks/celery_load.py --compare benchmarks/results/<earlier run>.json
+
+Tasks are published at a fixed rate, whether or not the workers keep up, and
+timed with worker events (switched on for the run): latency runs from publishing
+to task-succeeded, wait from publishing to task-started. Worker and benchmark
+clocks are assumed to agree, which holds when both run on the same host.
+
+notify_subscribers announces each picked event once, through NOTIFICATION_TRANSPORT;
+point it at a sink before running this against real subscribers.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sxodimsdu.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+
+from core import tasks  # noqa: E402
+from core.models import Event  # noqa: E402
+from sxodimsdu.celery import app  # noqa: E402
+
+# task -> weight; each task's queue comes from CELERY_TASK_ROUTES
+MIX = {
+    'fan_out_event': 60,
+    'notify_subscribers': 30,
+    'run_maintenance': 5,
+    'rebuild_trending': 4,
+    'build_recommendations': 1,
+}
+
+
+def queue_of(name):
+    return app.amqp.router.route({}, f'core.tasks.{name}')['queue'].name
+
+
+class Tracker:
+    """Publish times by task id, matched against worker events as they come in."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}
+        self.started = {}
+        self.samples = defaultdict(lambda: defaultdict(list))
+        self.failed = defaultdict(int)
+        self.done = set()
+
+    def publish(self, name, task, args):
+        sent = time.time()
+        result = task.apply_async(args)
+        with self.lock:
+            self.sent[result.id] = (name, sent)
+
+    def on_started(self, event):
+        with self.lock:
+            self.started[event['uuid']] = event['timestamp']
+
+    def on_finished(self, event):
+        with self.lock:
+            entry = self.sent.get(event['uuid'])
+            if entry is None or event['uuid'] in self.done:
+                return
+            self.done.add(event['uuid'])
+            name, sent = entry
+            if event['type'] == 'task-failed':
+                self.failed[name] += 1
+                return
+            samples = self.samples[name]
+            samples['latency'].append(event['timestamp'] - sent)
+            samples['runtime'].append(event.get('runtime') or 0)
+            if event['uuid'] in self.started:
+                samples['wait'].append(self.started[event['uuid']] - sent)
+
+    def outstanding(self):
+        with self.lock:
+            return len(self.sent) - len(self.done)
+
+    def summary(self, wall_time):
+        published = defaultdict(int)
+        for name, _ in self.sent.values():
+            published[name] += 1
+
+        result = {}
+        for name in sorted(published):
+            samples = self.samples[name]
+            completed = len(samples['latency'])
+            result[name] = {
+                'queue': queue_of(name),
+                'published': published[name],
+                'completed': completed,
+                'failed': self.failed[name],
+                'throughput_tps': round(completed / wall_time, 2),
+                **stats('latency', samples['latency']),
+                **stats('wait', samples['wait']),
+                **stats('runtime', samples['runtime']),
+            }
+        return result
+
+
+def stats(label, samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        f'{label}_p50_ms': percentile(ordered, 50),
+        f'{label}_p95_ms': percentile(ordered, 95),
+        f'{label}_p99_ms': percentile(ordered, 99),
+    }
+
+
+def percentile(ordered, pct):
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return round(ordered[index] * 1000, 2)
+
+
+def by_queue(tasks_summary):
+    queues = defaultdict(lambda: {'published': 0, 'completed': 0, 'failed': 0, 'throughput_tps': 0})
+    for stats_ in tasks_summary.values():
+        queue = queues[stats_['queue']]
+        for field in ('published', 'completed', 'failed', 'throughput_tps'):
+            queue[field] = round(queue[field] + stats_[field], 2)
+    return dict(sorted(queues.items()))
+
+
+def listen(tracker, stop):
+    """Feeds worker events to the tracker until `stop` is set."""
+    with app.connection_for_read() as connection:
+        receiver = app.events.Receiver(connection, handlers={
+            'task-started': tracker.on_started,
+            'task-succeeded': tracker.on_finished,
+            'task-failed': tracker.on_finished,
+        })
+        receiver.should_stop = False
+
+        def watch():
+            stop.wait()
+            receiver.should_stop = True
+
+        threading.Thread(target=watch, daemon=True).start()
+        receiver.capture(limit=None, timeout=None, wakeup=True)
+
+
+def task_args(name, events, rng):
+    if name in ('fan_out_event', 'notify_subscribers'):
+        return [rng.choice(events)]
+    if name == 'run_maintenance':
+        return ['refresh_rollups']
+    return []
+
+
+def run(args, tracker, rng):
+    events = list(Event.objects.filter(end_date__gte=timezone.now()).values_list('id', flat=True)[:1000])
+    if not events:
+        sys.exit('No current events; run manage.py seed_load first.')
+
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    interval = 1 / args.rate
+    deadline = time.monotonic() + args.duration
+    next_at = time.monotonic()
+    while next_at < deadline:
+        name = rng.choices(names, weights)[0]
+        task = getattr(tasks, name)
+        tracker.publish(name, task, task_args(name, events, rng))
+        next_at += interval
+        time.sleep(max(0, next_at - time.monotonic()))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, previous_path):
+    previous = json.loads(Path(previous_path).read_text())['tasks']
+    print(f'\n{"task":25} {"p95 before":>11} {"p95 now":>9} {"tps before":>11} {"tps now":>9}')
+    for name, stats_ in current.items():
+        before = previous.get(name)
+        if before:
+            print(f'{name:25} {before.get("latency_p95_ms", "-"):>11} {stats_.get("latency_p95_ms", "-"):>9} '
+                  f'{before["throughput_tps"]:>11} {stats_["throughput_tps"]:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=int, default=30, help='Seconds to publish tasks for.')
+    parser.add_argument('--rate', type=float, default=20, help='Tasks published per second.')
+    parser.add_argument('--drain', type=int, default=120,
+                        help='Seconds to wait for outstanding tasks after publishing stops.')
+    parser.add_argument('--output', help='Result file; defaults to benchmarks/results/celery-<commit>-<time>.json')
+    parser.add_argument('--compare', help='Earlier result file to compare against.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tracker, stop = Tracker(), threading.Event()
+    listener = threading.Thread(target=listen, args=(tracker, stop), daemon=True)
+    listener.start()
+    app.control.enable_events()
+    # Give the receiver time to bind its queue before the first task finishes
+    time.sleep(1)
+
+    started = time.monotonic()
+    try:
+        run(args, tracker, random.Random(args.seed))
+        drain_until = time.monotonic() + args.drain
+        while tracker.outstanding() and time.monotonic() < drain_until:
+            time.sleep(0.5)
+    finally:
+        app.control.disable_events()
+        stop.set()
+    wall_time = time.monotonic() - started
+
+    commit = git_commit()
+    summary = tracker.summary(wall_time)
+    result = {
+        'commit': commit,
+        'timestamp': timezone.now().isoformat(),
+        'rate': args.rate,
+        'duration_s': args.duration,
+        'wall_time_s': round(wall_time, 2),
+        'outstanding': tracker.outstanding(),
+        'queues': by_queue(summary),
+        'tasks': summary,
+    }
+
+    output = Path(args.output or BASE_DIR / 'benchmarks' / 'results' /
+                  f'celery-{commit}-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+
+    print(json.dumps(result, indent=2))
+    print(f'\nSaved to {output}')
+    if args.compare:
+        compare(summary, args.compare)
+
+
+if __name__ == '__main__':
+    main()
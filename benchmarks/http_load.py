@@ -0,0 +1,311 @@
+"""
+End-to-end HTTP load benchmark against a running stack seeded with `manage.py seed_load`.
+
+    python benchmarks/http_load.py --scenario mix --duration 60 --concurrency 50
+    python benchmarks/http_load.py --scenario contention --concurrency 300
+    python benchmarks/http_load.py --scenario mix --compare benchmarks/results/<earlier run>.json
+
+The database is read through the Django ORM (same settings as the server) only
+to pick users, heads and events; every measured request goes over HTTP.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sxodimsdu.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db.models import Exists, OuterRef  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from core.models import Club, ClubMember, Event, EventReview, Student, Ticket  # noqa: E402
+
+SCENARIO_WEIGHTS = {
+    'catalogue': {'catalogue': 1},
+    'purchase': {'purchase': 1},
+    'review': {'review': 1},
+    'dashboard': {'dashboard': 1},
+    'mix': {'catalogue': 70, 'dashboard': 15, 'purchase': 10, 'review': 5},
+}
+
+
+class Client:
+    """One keep-alive connection per worker thread."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=30)
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            return response.status, payload
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, label, elapsed, status):
+        with self.lock:
+            self.samples[label].append(elapsed)
+            self.statuses[label][str(status)] += 1
+
+    def timed(self, client, label, method, path, token=None, body=None):
+        started = time.perf_counter()
+        try:
+            status, payload = client.request(method, path, token, body)
+        except (http.client.HTTPException, OSError):
+            status, payload = 'error', b''
+        self.record(label, time.perf_counter() - started, status)
+        return status, payload
+
+    def summary(self, wall_time):
+        endpoints = {}
+        for label, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            endpoints[label] = {
+                'requests': len(ordered),
+                'throughput_rps': round(len(ordered) / wall_time, 2),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+                'p50_ms': percentile(ordered, 50),
+                'p95_ms': percentile(ordered, 95),
+                'p99_ms': percentile(ordered, 99),
+                'statuses': dict(self.statuses[label]),
+            }
+        return endpoints
+
+
+def percentile(ordered, pct):
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return round(ordered[index] * 1000, 2)
+
+
+def obtain_tokens(base_url, usernames, password):
+    client = Client(base_url)
+    tokens = {}
+    for username in usernames:
+        status, payload = client.request('POST', '/api/token/', body={'username': username, 'password': password})
+        if status == 200:
+            tokens[username] = json.loads(payload)['access']
+    return tokens
+
+
+class Dataset:
+    def __init__(self, args):
+        now = timezone.now()
+        prefix = args.prefix
+
+        students = list(Student.objects.filter(
+            username__startswith=f'{prefix}_student_'
+        ).order_by('?').values_list('username', 'id')[:args.users])
+        if not students:
+            sys.exit(f'No students with prefix "{prefix}"; run manage.py seed_load first.')
+
+        heads = list(ClubMember.objects.filter(
+            role=ClubMember.RoleChoices.HEAD, user__username__startswith=f'{prefix}_'
+        ).values_list('user__username', 'club_id')[:args.users])
+
+        self.tokens = obtain_tokens(args.base_url, [name for name, _ in students] + [name for name, _ in heads],
+                                    args.password)
+        self.students = [(self.tokens[name], pk) for name, pk in students if name in self.tokens]
+        self.heads = [(self.tokens[name], club) for name, club in heads if name in self.tokens]
+        self.upcoming = list(Event.objects.filter(start_date__gte=now).values_list('id', flat=True)[:1000])
+        self.club_events = defaultdict(list)
+        for event, club in Event.objects.filter(club_id__in=[club for _, club in self.heads]).values_list('id', 'club_id'):
+            self.club_events[club].append(event)
+
+        unreviewed = Ticket.objects.filter(
+            event__start_date__lt=now, student_id__in=[pk for _, pk in self.students]
+        ).exclude(Exists(EventReview.objects.filter(event=OuterRef('event'), user=OuterRef('student'))))
+        by_student = {pk: token for token, pk in self.students}
+        self.reviewable = [(by_student[student], event)
+                           for student, event in unreviewed.values_list('student_id', 'event_id')[:5000]]
+
+
+def catalogue(client, recorder, data, rng):
+    recorder.timed(client, 'GET /api/events/?upcoming=true', 'GET', '/api/events/?upcoming=true')
+    if data.upcoming:
+        recorder.timed(client, 'GET /api/events/<pk>/', 'GET', f'/api/events/{rng.choice(data.upcoming)}/')
+    if rng.random() < 0.3:
+        recorder.timed(client, 'GET /api/clubs/', 'GET', '/api/clubs/')
+
+
+def purchase(client, recorder, data, rng):
+    if not data.upcoming or not data.students:
+        return
+    token, student = rng.choice(data.students)
+    recorder.timed(client, 'POST /api/tickets/', 'POST', '/api/tickets/', token,
+                   {'event': rng.choice(data.upcoming), 'student': student})
+
+
+def review(client, recorder, data, rng):
+    try:
+        token, event = data.reviewable.pop()
+    except IndexError:
+        return
+    recorder.timed(client, 'POST /api/events/<pk>/reviews/', 'POST', f'/api/events/{event}/reviews/', token,
+                   {'event': event, 'rating': rng.randint(1, 5), 'comment': 'benchmark'})
+
+
+def dashboard(client, recorder, data, rng):
+    if not data.heads:
+        return
+    token, club = rng.choice(data.heads)
+    recorder.timed(client, 'GET /api/clubs/<pk>/members/', 'GET', f'/api/clubs/{club}/members/', token)
+    recorder.timed(client, 'GET /api/clubs/<pk>/subscriptions/', 'GET', f'/api/clubs/{club}/subscriptions/', token)
+    if data.club_events[club]:
+        event = rng.choice(data.club_events[club])
+        recorder.timed(client, 'GET /api/events/<pk>/tickets/', 'GET', f'/api/events/{event}/tickets/', token)
+    recorder.timed(client, 'GET /api/reviews/', 'GET', '/api/reviews/', token)
+
+
+ACTIONS = {'catalogue': catalogue, 'purchase': purchase, 'review': review, 'dashboard': dashboard}
+
+
+def run_mix(args, data, recorder):
+    weights = SCENARIO_WEIGHTS[args.scenario]
+    names, cum = list(weights), []
+    for name in names:
+        cum.append((cum[-1] if cum else 0) + weights[name])
+    deadline = time.monotonic() + args.duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = Client(args.base_url)
+        while time.monotonic() < deadline:
+            ACTIONS[rng.choices(names, cum_weights=cum)[0]](client, recorder, data, rng)
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    return {}
+
+
+def run_contention(args, data, recorder):
+    """Every client buys a ticket for the same event at the same moment."""
+    buyers = data.students[:args.concurrency]
+    if not buyers:
+        sys.exit('No students could log in; check --prefix and --password.')
+
+    club = Club.objects.first()
+    start = timezone.now() + timedelta(days=30)
+    event = Event.objects.create(
+        title='benchmark contention', club=club, start_date=start, end_date=start + timedelta(hours=2),
+        ticket_price=0, total_tickets=args.contention_capacity,
+    )
+    barrier = threading.Barrier(len(buyers))
+
+    def buyer(entry):
+        token, student = entry
+        client = Client(args.base_url)
+        barrier.wait()
+        recorder.timed(client, 'POST /api/tickets/ (contention)', 'POST', '/api/tickets/', token,
+                       {'event': event.pk, 'student': student})
+
+    try:
+        with ThreadPoolExecutor(len(buyers)) as pool:
+            list(pool.map(buyer, buyers))
+        sold = Ticket.objects.filter(event=event).count()
+    finally:
+        # Its tickets go with it
+        event.delete()
+    return {'contention': {'event': event.pk, 'buyers': len(buyers), 'capacity': event.total_tickets,
+                           'sold': sold, 'oversold': max(0, sold - event.total_tickets)}}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, previous_path):
+    previous = json.loads(Path(previous_path).read_text())['endpoints']
+    print(f'\n{"endpoint":45} {"p95 before":>11} {"p95 now":>9} {"rps before":>11} {"rps now":>9}')
+    for label, stats in current.items():
+        before = previous.get(label)
+        if before:
+            print(f'{label:45} {before["p95_ms"]:>11} {stats["p95_ms"]:>9} '
+                  f'{before["throughput_rps"]:>11} {stats["throughput_rps"]:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--scenario', default='mix', choices=[*SCENARIO_WEIGHTS, 'contention'])
+    parser.add_argument('--duration', type=int, default=30, help='Seconds to run mixed scenarios for.')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--users', type=int, default=300, help='Seeded students to log in as.')
+    parser.add_argument('--contention-capacity', type=int, default=50,
+                        help='Tickets available to the contention scenario buyers.')
+    parser.add_argument('--prefix', default='load', help='Prefix passed to seed_load.')
+    parser.add_argument('--password', default='loadtest123', help='Password passed to seed_load.')
+    parser.add_argument('--output', help='Result file; defaults to benchmarks/results/<scenario>-<commit>-<time>.json')
+    parser.add_argument('--compare', help='Earlier result file to compare against.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    data = Dataset(args)
+    recorder = Recorder()
+
+    started = time.monotonic()
+    runner = run_contention if args.scenario == 'contention' else run_mix
+    extra = runner(args, data, recorder)
+    wall_time = time.monotonic() - started
+
+    commit = git_commit()
+    result = {
+        'commit': commit,
+        'timestamp': timezone.now().isoformat(),
+        'scenario': args.scenario,
+        'concurrency': args.concurrency,
+        'wall_time_s': round(wall_time, 2),
+        'endpoints': recorder.summary(wall_time),
+        **extra,
+    }
+
+    output = Path(args.output or BASE_DIR / 'benchmarks' / 'results' /
+                  f'{args.scenario}-{commit}-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+
+    print(json.dumps(result, indent=2))
+    print(f'\nSaved to {output}')
+    if args.compare:
+        compare(result['endpoints'], args.compare)
+
+
+if __name__ == '__main__':
+    main()
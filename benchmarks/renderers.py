@@ -0,0 +1,89 @@
+"""
+Renders a 5k-event list payload with DRF's JSONRenderer and ORJSONRenderer and
+compresses it with gzip and brotli at the levels used by CompressionMiddleware.
+
+    python benchmarks/renderers.py --events 5000 --repeat 20
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sxodimsdu.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import brotli  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from core.models import Club, Event, Room  # noqa: E402
+from core.renderers import ORJSONRenderer  # noqa: E402
+from core.serializers import EventSerializer  # noqa: E402
+
+
+def build_payload(count):
+    now = timezone.now()
+    clubs = [Club(id=n, name=f'Club {n}') for n in range(50)]
+    rooms = [Room(id=n, name=f'Room {n}', capacity=100) for n in range(20)]
+    events = []
+    for n in range(count):
+        start = now + timedelta(hours=n)
+        event = Event(
+            id=n, title=f'Event {n}', description='Talks, workshops and networking for students. ' * 4,
+            club=clubs[n % len(clubs)], room=rooms[n % len(rooms)], start_date=start,
+            end_date=start + timedelta(hours=2), ticket_price=Decimal('1500.00'), total_tickets=200,
+            created_at=now, ticket_type=Event.TicketTypeChoices.PAID,
+        )
+        event.sold_ticket_count = n % 200
+        events.append(event)
+    return EventSerializer(events, many=True).data
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    serialize_ms, data = timed(lambda: build_payload(args.events), max(1, args.repeat // 5))
+    print(f'{args.events} events, serializer: {serialize_ms:.1f} ms (best of {max(1, args.repeat // 5)})\n')
+
+    print(f'{"renderer":24} {"best ms":>9} {"bytes":>10}')
+    body = None
+    for name, renderer in (('DRF JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer())):
+        elapsed, body = timed(lambda: renderer.render(data, 'application/json'), args.repeat)
+        print(f'{name:24} {elapsed:>9.2f} {len(body):>10}')
+
+    print(f'\n{"encoding":24} {"best ms":>9} {"bytes":>10} {"ratio":>7}')
+    encoders = (
+        (f'gzip level {settings.COMPRESSION_GZIP_LEVEL}',
+         lambda: gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)),
+        (f'brotli quality {settings.COMPRESSION_BROTLI_QUALITY}',
+         lambda: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)),
+    )
+    for name, encode in encoders:
+        elapsed, compressed = timed(encode, args.repeat)
+        print(f'{name:24} {elapsed:>9.2f} {len(compressed):>10} {len(body) / len(compressed):>7.1f}')
+
+
+if __name__ == '__main__':
+    main()
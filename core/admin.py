@@ -1,13 +1,126 @@
 from django.contrib import admin
-from .models import Student, Club, ClubMember, Event, Room, Ticket, EventReview, Subscription
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
+from .models import (
+    Student, Club, ClubMember, Event, Room, Ticket, CheckIn, EventReview, Subscription, MaintenanceCheckpoint,
+)
 
-admin.site.register(Student)
-admin.site.register(Club)
-admin.site.register(ClubMember)
-admin.site.register(Event)
-admin.site.register(Room)
-admin.site.register(Ticket)
-admin.site.register(EventReview)
-admin.site.register(Subscription)
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the planner's row estimate from pg_class for unfiltered changelists instead
+    of COUNT(*), which reads the whole table. Small tables, filtered querysets and
+    other databases are counted exactly.
+    """
+
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                # A partitioned table (core_ticket) has no rows of its own, so its
+                # estimate is the sum of its partitions'
+                cursor.execute(
+                    "SELECT CASE WHEN parent.relkind = 'p' THEN ("
+                    "    SELECT CASE WHEN bool_or(child.reltuples < 0) THEN -1 ELSE SUM(child.reltuples) END"
+                    "    FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+                    "    WHERE pg_inherits.inhparent = parent.oid"
+                    ") ELSE parent.reltuples END::bigint "
+                    "FROM pg_class parent WHERE parent.oid = %s::regclass",
+                    [self.object_list.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed or analyzed
+            if row and row[0] is not None and row[0] >= self.exact_below:
+                return row[0]
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second COUNT(*) of the whole table behind "N results (M total)"
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Student)
+class StudentAdmin(LargeTableAdmin):
+    list_display = ('username', 'email', 'faculty', 'is_staff')
+    search_fields = ('username', 'email')
+
+
+@admin.register(Club)
+class ClubAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_at')
+    search_fields = ('name',)
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'capacity')
+    search_fields = ('name',)
+
+
+@admin.register(Event)
+class EventAdmin(LargeTableAdmin):
+    list_display = ('title', 'club', 'room', 'start_date', 'ticket_type')
+    list_select_related = ('club', 'room')
+    list_filter = ('ticket_type',)
+    search_fields = ('title',)
+    autocomplete_fields = ('club', 'room')
+
+
+@admin.register(ClubMember)
+class ClubMemberAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'club', 'role', 'joined_at')
+    list_select_related = ('user', 'club')
+    list_filter = ('role',)
+    search_fields = ('user__username', 'club__name')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('club',)
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'club', 'subscribed_at')
+    list_select_related = ('user', 'club')
+    search_fields = ('user__username', 'club__name')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('club',)
+
+
+@admin.register(Ticket)
+class TicketAdmin(LargeTableAdmin):
+    list_display = ('id', 'student', 'event', 'purchased_at')
+    list_select_related = ('student', 'event')
+    list_filter = ('purchased_at',)
+    search_fields = ('student__username', 'event__title')
+    raw_id_fields = ('student', 'event')
+
+
+@admin.register(CheckIn)
+class CheckInAdmin(LargeTableAdmin):
+    list_display = ('id', 'ticket', 'event', 'scanned_at', 'scanned_by')
+    list_select_related = ('ticket__student', 'ticket__event', 'event', 'scanned_by')
+    raw_id_fields = ('ticket', 'event', 'scanned_by')
+
+
+@admin.register(EventReview)
+class EventReviewAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'event', 'rating', 'created_at')
+    list_select_related = ('user', 'event')
+    list_filter = ('rating',)
+    search_fields = ('user__username', 'event__title')
+    raw_id_fields = ('user', 'event')
+
+
+@admin.register(MaintenanceCheckpoint)
+class MaintenanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_outcome', 'last_run_at', 'last_runtime', 'last_processed', 'completed_at', 'cursor')
+    readonly_fields = ('name', 'pass_started_at', 'completed_at', 'last_run_at', 'last_outcome', 'last_runtime',
+                       'last_processed')
@@ -0,0 +1,142 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Event, EventDailyStats, EventReview, RollupWatermark, Ticket
+
+# Each source is read in purchased_at/created_at order from its watermark. Rows are only
+# read once they are ROLLUP_LAG old, so a transaction that commits late with an older
+# timestamp is still picked up.
+SOURCES = {
+    'tickets': (Ticket, 'purchased_at', 'tickets_sold'),
+    'reviews': (EventReview, 'created_at', 'reviews'),
+}
+
+
+def _window_end(queryset, field, start, cutoff):
+    """Timestamp of the last row of the next batch, or None when there is nothing to read."""
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gt': start})
+    timestamps = queryset.filter(**{f'{field}__lte': cutoff}).order_by(field).values_list(field, flat=True)
+    batch = list(timestamps[settings.ROLLUP_BATCH_SIZE - 1:settings.ROLLUP_BATCH_SIZE])
+    if batch:
+        # Rows sharing this timestamp are all included, so the batch may run a little over
+        return batch[0]
+    return timestamps.last()
+
+
+def _ticket_deltas(queryset):
+    rows = queryset.annotate(day=TruncDate('purchased_at')).values('event_id', 'event__club_id', 'day').annotate(
+        count=Count('id'),
+        revenue=Sum('event__ticket_price'),
+    ).order_by()
+    return {(row['event_id'], row['day']): (row['event__club_id'], {
+        'tickets_sold': row['count'],
+        'revenue': row['revenue'] or Decimal('0'),
+    }) for row in rows}
+
+
+def _review_deltas(queryset):
+    rows = queryset.annotate(day=TruncDate('created_at')).values('event_id', 'event__club_id', 'day').annotate(
+        count=Count('id'),
+        rating_sum=Sum('rating'),
+    ).order_by()
+    return {(row['event_id'], row['day']): (row['event__club_id'], {
+        'reviews': row['count'],
+        'rating_sum': row['rating_sum'],
+    }) for row in rows}
+
+
+DELTAS = {'tickets': _ticket_deltas, 'reviews': _review_deltas}
+
+
+def _apply(deltas):
+    """Adds `deltas` to the rollup rows they belong to with one read and one upsert."""
+    if not deltas:
+        return
+    events = {event_id for event_id, _ in deltas}
+    days = {day for _, day in deltas}
+    current = {
+        (row.event_id, row.day): row
+        for row in EventDailyStats.objects.filter(event_id__in=events, day__in=days)
+    }
+
+    rows = []
+    for (event_id, day), (club_id, values) in deltas.items():
+        row = current.get((event_id, day)) or EventDailyStats(club_id=club_id, event_id=event_id, day=day)
+        for field, value in values.items():
+            setattr(row, field, getattr(row, field) + value)
+        rows.append(row)
+
+    EventDailyStats.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['event', 'day'],
+        update_fields=['tickets_sold', 'revenue', 'reviews', 'rating_sum'],
+    )
+
+
+def update_rollup(name):
+    """Rolls up one batch of `name` past its watermark. Returns the number of source rows read."""
+    model, field, counter = SOURCES[name]
+    cutoff = timezone.now() - timedelta(seconds=settings.ROLLUP_LAG)
+
+    with transaction.atomic():
+        RollupWatermark.objects.get_or_create(name=name)
+        # Held until commit, so overlapping runs wait instead of counting rows twice
+        watermark = RollupWatermark.objects.select_for_update().get(name=name)
+        end = _window_end(model.objects.all(), field, watermark.position, cutoff)
+        if end is None:
+            return 0
+
+        batch = model.objects.filter(**{f'{field}__lte': end})
+        if watermark.position is not None:
+            batch = batch.filter(**{f'{field}__gt': watermark.position})
+        deltas = DELTAS[name](batch)
+        _apply(deltas)
+
+        watermark.position = end
+        watermark.save(update_fields=['position'])
+        return sum(values[counter] for _, values in deltas.values())
+
+
+def subtract_ticket(ticket):
+    """Takes a deleted ticket out of the rollup if it was already counted."""
+    position = RollupWatermark.objects.filter(name='tickets').values_list('position', flat=True).first()
+    if position is None or ticket.purchased_at > position:
+        return
+    price = Event.objects.filter(pk=OuterRef('event_id')).values('ticket_price')[:1]
+    EventDailyStats.objects.filter(event_id=ticket.event_id, day=timezone.localdate(ticket.purchased_at)).update(
+        tickets_sold=F('tickets_sold') - 1,
+        revenue=F('revenue') - Subquery(price),
+    )
+
+
+def club_analytics(club_id, start, end):
+    """Daily series and per-event totals for one club between two dates, from rollups only."""
+    rows = EventDailyStats.objects.filter(club_id=club_id, day__gte=start, day__lte=end)
+    sums = {f'total_{name}': Sum(name) for name in ('tickets_sold', 'revenue', 'reviews', 'rating_sum')}
+
+    daily = rows.values('day').annotate(**sums).order_by('day')
+    events = rows.values('event_id', 'event__title').annotate(**sums).order_by('-total_revenue', 'event_id')
+    return {
+        'start': start,
+        'end': end,
+        'daily': [{'day': row['day'], **_totals(row)} for row in daily],
+        'events': [{'event': row['event_id'], 'title': row['event__title'], **_totals(row)} for row in events],
+    }
+
+
+def _totals(row):
+    reviews = row['total_reviews']
+    return {
+        'tickets_sold': row['total_tickets_sold'],
+        'revenue': row['total_revenue'],
+        'reviews': reviews,
+        'average_rating': round(row['total_rating_sum'] / reviews, 2) if reviews else None,
+    }
@@ -0,0 +1,166 @@
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import ClubMember
+
+logger = logging.getLogger(__name__)
+
+ROLE_VERSION_CLAIM = 'role_version'
+# Student.role_version is the source of truth; Redis keeps a copy so authenticating
+# a request does not touch the database. Copies only ever move up, so a reader
+# filling the cache with a version it loaded before a bump cannot overwrite the bump.
+ROLE_VERSION_TTL = 60 * 60 * 24
+CACHE_ROLE_VERSION = """
+local cached = tonumber(redis.call('GET', KEYS[1]))
+if cached and cached >= tonumber(ARGV[1]) then
+    return cached
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return tonumber(ARGV[1])
+"""
+
+
+def role_version_key(user_id):
+    return f'auth:role_version:{user_id}'
+
+
+def cache_role_version(user_id, version):
+    """Returns the cached version, which is `version` unless a newer one is already cached."""
+    conn = get_redis_connection('default')
+    return int(conn.register_script(CACHE_ROLE_VERSION)(keys=[role_version_key(user_id)],
+                                                        args=[version, ROLE_VERSION_TTL]))
+
+
+def get_role_version(user_id):
+    """The user's current role version, or None when the user no longer exists."""
+    cached = get_redis_connection('default').get(role_version_key(user_id))
+    if cached is not None:
+        return int(cached)
+    version = get_user_model().objects.filter(pk=user_id).values_list('role_version', flat=True).first()
+    if version is None:
+        return None
+    return cache_role_version(user_id, version)
+
+
+def bump_role_version(user_id):
+    """Tokens issued before this call are rejected until the client refreshes them."""
+    bump_role_versions([user_id])
+
+
+def bump_role_versions(user_ids):
+    """
+    bump_role_version() for many users at once. The database is bumped in the
+    current transaction and the cached copies once it commits.
+    """
+    User = get_user_model()
+    User.objects.filter(pk__in=user_ids).update(role_version=F('role_version') + 1)
+
+    def refresh_cache():
+        try:
+            versions = dict(User.objects.filter(pk__in=user_ids).values_list('pk', 'role_version'))
+            conn = get_redis_connection('default')
+            script = conn.register_script(CACHE_ROLE_VERSION)
+            with conn.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    if user_id in versions:
+                        script(keys=[role_version_key(user_id)], args=[versions[user_id], ROLE_VERSION_TTL],
+                               client=pipe)
+                    else:
+                        pipe.delete(role_version_key(user_id))
+                pipe.execute()
+        except RedisError:
+            logger.warning("Could not cache role versions for users %s", user_ids, exc_info=True)
+
+    transaction.on_commit(refresh_cache)
+
+
+def add_role_claims(token, user):
+    # The version was loaded with the user, before the head clubs are read, so a role
+    # change racing with this leaves the token stale rather than wrong
+    token[ROLE_VERSION_CLAIM] = user.role_version
+    token['is_staff'] = user.is_staff
+    token['head_clubs'] = list(ClubMember.objects.filter(
+        user_id=user.pk,
+        role=ClubMember.RoleChoices.HEAD
+    ).values_list('club_id', flat=True))
+    try:
+        cache_role_version(user.pk, user.role_version)
+    except RedisError:
+        logger.warning("Could not cache role version for user %s", user.pk, exc_info=True)
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_role_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # Claims copied from the refresh token may predate a role change
+        access = AccessToken(data['access'])
+        user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]})
+        data['access'] = str(add_role_claims(access, user))
+        return data
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    request.user for a token with role claims. id, is_staff and head_club_ids come
+    from the token; any other attribute loads the Student on first use.
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id}))
+        self.__dict__.update(
+            id=user_id,
+            pk=user_id,
+            is_staff=token['is_staff'],
+            head_club_ids=frozenset(token['head_clubs']),
+            is_authenticated=True,
+            is_anonymous=False,
+        )
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f'<ClaimsUser: {self.id}>'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Trusts the user id, staff flag and head clubs in the access token as long as its
+    role version is current. Tokens without role claims, or a Redis outage, fall back
+    to loading the user like JWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        if ROLE_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            current = get_role_version(validated_token[api_settings.USER_ID_CLAIM])
+        except RedisError:
+            logger.warning("Role version store unavailable, loading user from the database", exc_info=True)
+            return super().get_user(validated_token)
+
+        if current is None:
+            raise InvalidToken("User not found.")
+        if validated_token[ROLE_VERSION_CLAIM] != current:
+            raise InvalidToken("Roles have changed since this token was issued, refresh it.")
+        return ClaimsUser(validated_token)
@@ -0,0 +1,422 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.http import HttpResponse
+from django.utils.cache import cc_delim_re, patch_response_headers
+from django_redis.cache import RedisCache
+
+from core.metrics import CACHE_TIER, PAGE_CACHE
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+
+
+class LocalTier:
+    """
+    Thread-safe LRU of pickled values with a per-entry deadline. Values are kept
+    pickled so callers that mutate what they got (cache_page responses) cannot
+    change the cached copy.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, payload = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+        return True, pickle.loads(payload)
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_pattern(self, pattern):
+        with self._lock:
+            for key in [key for key in self._entries if fnmatchcase(key, pattern)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache(RedisCache):
+    """
+    django-redis with a per-process LRU in front of it for keys matching
+    LOCAL_KEY_PATTERNS. Writes and deletes are published on INVALIDATION_CHANNEL
+    and every process drops its local copy; LOCAL_TIMEOUT bounds how stale a copy
+    can get if a message is missed. The local tier is bypassed while a process is
+    not subscribed.
+
+    OPTIONS: LOCAL_MAX_ENTRIES (default 1000), LOCAL_TIMEOUT in seconds (default 5),
+    LOCAL_KEY_PATTERNS as glob patterns on the full key (default none).
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get('OPTIONS', {})
+        self._local = LocalTier(options.get('LOCAL_MAX_ENTRIES', 1000), options.get('LOCAL_TIMEOUT', 5))
+        self._local_patterns = tuple(options.get('LOCAL_KEY_PATTERNS', ()))
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self._subscribed = threading.Event()
+
+    def _is_local(self, key):
+        return any(fnmatchcase(key, pattern) for pattern in self._local_patterns)
+
+    def _local_ready(self):
+        # Gunicorn forks after the cache may have been used, so each process starts its own listener
+        if self._listener_pid != os.getpid():
+            with self._listener_lock:
+                if self._listener_pid != os.getpid():
+                    self._listener_pid = os.getpid()
+                    self._subscribed = threading.Event()
+                    self._local.clear()
+                    threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+        return self._subscribed.is_set()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.get_client(write=False).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything may have changed while this process was not subscribed
+                self._local.clear()
+                self._subscribed.set()
+                for message in pubsub.listen():
+                    self._apply(json.loads(message['data']))
+            except Exception:
+                logger.warning("Cache invalidation listener disconnected", exc_info=True)
+            self._subscribed.clear()
+            self._local.clear()
+            time.sleep(1)
+
+    def _apply(self, message):
+        if 'keys' in message:
+            self._local.delete(message['keys'])
+        elif 'pattern' in message:
+            self._local.delete_pattern(message['pattern'])
+        else:
+            self._local.clear()
+
+    def _invalidate(self, message):
+        self._apply(message)
+        try:
+            self.client.get_client(write=True).publish(INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception:
+            logger.warning("Could not publish cache invalidation", exc_info=True)
+
+    def _invalidate_keys(self, keys, version=None):
+        keys = [str(self.make_key(key, version=version)) for key in keys]
+        keys = [key for key in keys if self._is_local(key)]
+        if keys:
+            self._invalidate({'keys': keys})
+
+    def get(self, key, default=None, version=None, client=None):
+        full_key = str(self.make_key(key, version=version))
+        if client is not None or not self._is_local(full_key) or not self._local_ready():
+            return super().get(key, default, version, client)
+
+        hit, value = self._local.get(full_key)
+        if hit:
+            CACHE_TIER.labels('local', 'hit').inc()
+            return value
+        CACHE_TIER.labels('local', 'miss').inc()
+
+        missing = object()
+        value = super().get(key, missing, version)
+        if value is missing:
+            CACHE_TIER.labels('redis', 'miss').inc()
+            return default
+        CACHE_TIER.labels('redis', 'hit').inc()
+        self._local.set(full_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, *args, **kwargs):
+        result = super().set(key, value, timeout, version, *args, **kwargs)
+        self._invalidate_keys([key], version)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, *args, **kwargs):
+        result = super().add(key, value, timeout, version, *args, **kwargs)
+        if result:
+            self._invalidate_keys([key], version)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, *args, **kwargs):
+        result = super().set_many(data, timeout, version, *args, **kwargs)
+        self._invalidate_keys(data, version)
+        return result
+
+    def incr(self, key, delta=1, version=None, *args, **kwargs):
+        result = super().incr(key, delta, version, *args, **kwargs)
+        self._invalidate_keys([key], version)
+        return result
+
+    def decr(self, key, delta=1, version=None, *args, **kwargs):
+        result = super().decr(key, delta, version, *args, **kwargs)
+        self._invalidate_keys([key], version)
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None, *args, **kwargs):
+        result = super().touch(key, timeout, version, *args, **kwargs)
+        self._invalidate_keys([key], version)
+        return result
+
+    def delete(self, key, version=None, *args, **kwargs):
+        result = super().delete(key, version, *args, **kwargs)
+        self._invalidate_keys([key], version)
+        return result
+
+    def delete_many(self, keys, version=None, *args, **kwargs):
+        result = super().delete_many(keys, version, *args, **kwargs)
+        self._invalidate_keys(keys, version)
+        return result
+
+    def delete_pattern(self, pattern, version=None, **kwargs):
+        result = super().delete_pattern(pattern, version=version, **kwargs)
+        self._invalidate({'pattern': str(self.client.make_pattern(pattern, version=version))})
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._invalidate({})
+        return result
+
+
+# Keys contain ".<prefix>." so patterns like "*.event_list.*" match them
+PAGE_CACHE_PATTERN = 'views.single_flight.*'
+
+
+def generation_key(prefix):
+    return f'views.single_flight.{prefix}.generation'
+
+
+def invalidate_cached(prefix):
+    """
+    Marks everything cached under `prefix` stale. Stale copies are still served
+    while one caller rebuilds them, unlike delete_pattern.
+    """
+    key = generation_key(prefix)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def _state(entry, generation, beta):
+    if entry is None:
+        return 'miss'
+    now = time.time()
+    if entry['generation'] != generation or now >= entry['expires_at']:
+        return 'stale'
+    # Probabilistic early expiry (XFetch): the longer a rebuild takes, the earlier
+    # some caller volunteers for it, so entries rarely expire under load
+    if now - entry['delta'] * beta * math.log(1 - random.random()) >= entry['expires_at']:
+        return 'early'
+    return 'hit'
+
+
+class SingleFlight:
+    """
+    One cached value with single-flight rebuilds. Only the caller holding the
+    short Redis lock recomputes; everyone else gets the stale copy, or waits for
+    the first copy when there is none yet.
+    """
+
+    def __init__(self, prefix, name, timeout, beta=1.0, lock_timeout=10):
+        digest = hashlib.md5(name.encode()).hexdigest()
+        self.prefix = prefix
+        self.key = f'views.single_flight.{prefix}.{digest}'
+        self.lock_key = f'single_flight_lock:{prefix}:{digest}'
+        self.timeout = timeout
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+
+    def lookup(self):
+        self.generation = cache.get(generation_key(self.prefix), 0)
+        entry = cache.get(self.key)
+        return entry, _state(entry, self.generation, self.beta)
+
+    def acquire(self):
+        return cache.add(self.lock_key, 1, self.lock_timeout)
+
+    def release(self):
+        cache.delete(self.lock_key)
+
+    def store(self, value, delta):
+        entry = {
+            'value': value,
+            'generation': self.generation,
+            'expires_at': time.time() + self.timeout,
+            'delta': delta,
+        }
+        # Kept past expiry so there is a stale copy to serve during the rebuild
+        cache.set(self.key, entry, self.timeout * 2)
+
+    def wait(self):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(self.key)
+            if entry is not None:
+                return entry
+            if not cache.has_key(self.lock_key):
+                return None
+        return None
+
+    def get(self, compute):
+        entry, state = self.lookup()
+        if state == 'hit':
+            return entry['value']
+
+        if self.acquire():
+            try:
+                started = time.perf_counter()
+                value = compute()
+                self.store(value, time.perf_counter() - started)
+                return value
+            finally:
+                self.release()
+
+        if entry is None:
+            entry = self.wait()
+        return entry['value'] if entry is not None else compute()
+
+
+def cached_value(prefix, name, timeout, compute, **kwargs):
+    """``compute()`` cached under ``prefix``, rebuilt by one caller at a time."""
+    return SingleFlight(prefix, name, timeout, **kwargs).get(compute)
+
+
+def _cached_response(entry):
+    content, status, headers = entry['value']
+    response = HttpResponse(content, status=status)
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+# Request headers every page is keyed on, whatever its Vary header says
+PAGE_KEY_HEADERS = ['HTTP_ACCEPT']
+
+
+def _page_headers_key(key_prefix, request):
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'views.single_flight_headers.{key_prefix}.{digest}'
+
+
+def _page_name(request, headers):
+    return '|'.join([request.build_absolute_uri(), *(request.META.get(header, '') for header in headers)])
+
+
+def _vary_headers(response):
+    """Request headers named by the response's Vary header as META keys, or None for Vary: *."""
+    headers = set(PAGE_KEY_HEADERS)
+    if response.has_header('Vary'):
+        for header in cc_delim_re.split(response.headers['Vary']):
+            if header == '*':
+                return None
+            headers.add('HTTP_' + header.upper().replace('-', '_'))
+    return sorted(headers)
+
+
+def single_flight_cache_page(timeout, *, key_prefix, beta=1.0, lock_timeout=10):
+    """
+    Page cache for GET and HEAD with stampede protection. Invalidate with
+    ``invalidate_cached(key_prefix)``. Like ``cache_page``, pages are keyed on the
+    absolute URL and the request headers their Vary header lists, which are learnt
+    from the first response for the URL; the Accept header always counts.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            headers_key = _page_headers_key(key_prefix, request)
+            headers = cache.get(headers_key) or PAGE_KEY_HEADERS
+            flight = SingleFlight(key_prefix, _page_name(request, headers), timeout,
+                                  beta=beta, lock_timeout=lock_timeout)
+            entry, state = flight.lookup()
+            if state == 'hit':
+                PAGE_CACHE.labels(key_prefix, 'hit').inc()
+                return _cached_response(entry)
+
+            if not flight.acquire():
+                if entry is None:
+                    entry = flight.wait()
+                    state = 'waited'
+                else:
+                    state = 'hit' if state == 'early' else 'stale_served'
+                if entry is not None:
+                    PAGE_CACHE.labels(key_prefix, state).inc()
+                    return _cached_response(entry)
+                return view_func(request, *args, **kwargs)
+
+            PAGE_CACHE.labels(key_prefix, state).inc()
+            started = time.perf_counter()
+
+            def store(response):
+                try:
+                    vary = _vary_headers(response)
+                    if response.status_code == 200 and not response.cookies and vary is not None:
+                        patch_response_headers(response, timeout)
+                        value = (response.content, response.status_code, list(response.items()))
+                        target = flight
+                        if vary != headers:
+                            cache.set(headers_key, vary, timeout * 2)
+                            target = SingleFlight(key_prefix, _page_name(request, vary), timeout, beta=beta)
+                            target.generation = flight.generation
+                        target.store(value, time.perf_counter() - started)
+                finally:
+                    flight.release()
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                flight.release()
+                raise
+
+            # DRF responses are rendered after the view returns
+            if getattr(response, 'is_rendered', True):
+                store(response)
+            else:
+                response.add_post_render_callback(store)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,48 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set by ReplicaRoutingMiddleware for the current request only
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def route_reads_to_replica(enabled):
+    return _read_from_replica.set(enabled)
+
+
+def reset_read_routing(token):
+    _read_from_replica.reset(token)
+
+
+def stick_to_primary(execute, sql, params, many, context):
+    """
+    execute_wrapper for the primary: after the first statement that isn't a SELECT,
+    the rest of the request reads from the primary too, so it sees what it wrote.
+    """
+    if not sql.lstrip()[:6].upper() == 'SELECT':
+        _read_from_replica.set(False)
+    return execute(sql, params, many, context)
+
+
+class ReplicaRouter:
+    """
+    Reads go to one of DATABASE_REPLICAS while the middleware allows it, everything
+    else goes to the primary. Django also asks for the write database when relations
+    are assigned, so routing only changes on statements the primary actually runs
+    (stick_to_primary), not here.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,196 @@
+import math
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from core.models import Event, Subscription
+
+# feed:<user id> holds upcoming events from the clubs a student subscribes to,
+# scored by start time. Events of clubs with more than FEED_FANOUT_LIMIT
+# subscribers are not copied into every feed; they stay in feed:club:<club id>
+# and are merged in when the feed is read.
+PULL_CLUBS_KEY = 'feed:pull_clubs'
+
+
+def feed_key(user_id):
+    return f'feed:{user_id}'
+
+
+def feed_ready_key(user_id):
+    return f'feed:{user_id}:ready'
+
+
+def club_key(club_id):
+    return f'feed:club:{club_id}'
+
+
+def event_member(event_id):
+    # Zero padding keeps events with the same start time in id order
+    return f'{event_id:012d}'
+
+
+def connection():
+    return get_redis_connection('default')
+
+
+def add_event_to_feeds(event_id):
+    try:
+        event = Event.objects.only('id', 'club_id', 'start_date').get(pk=event_id)
+    except Event.DoesNotExist:
+        return 0
+
+    conn = connection()
+    member, score = event_member(event.pk), event.start_date.timestamp()
+    with conn.pipeline(transaction=False) as pipe:
+        pipe.zadd(club_key(event.club_id), {member: score})
+        # Past events are never read again
+        pipe.zremrangebyscore(club_key(event.club_id), '-inf', timezone.now().timestamp())
+        pipe.execute()
+
+    subscribers = Subscription.objects.filter(club_id=event.club_id)
+    if subscribers.count() > settings.FEED_FANOUT_LIMIT:
+        conn.sadd(PULL_CLUBS_KEY, event.club_id)
+        return 0
+
+    fanned_out = 0
+    last_id = 0
+    while True:
+        chunk = list(subscribers.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id')[:1000])
+        if not chunk:
+            return fanned_out
+        last_id = chunk[-1][0]
+        with conn.pipeline(transaction=False) as pipe:
+            for _, user_id in chunk:
+                push(pipe, user_id, {member: score})
+            pipe.execute()
+        fanned_out += len(chunk)
+
+
+def push(pipe, user_id, members):
+    key = feed_key(user_id)
+    pipe.zadd(key, members)
+    pipe.zremrangebyscore(key, '-inf', timezone.now().timestamp())
+    pipe.zremrangebyrank(key, settings.FEED_MAX_LENGTH, -1)
+    pipe.expire(key, settings.FEED_TTL)
+
+
+def remove_event_from_feeds(event_id, club_id):
+    # Copies in subscriber feeds are dropped when they fail to load on read
+    connection().zrem(club_key(club_id), event_member(event_id))
+
+
+def backfill_subscription(user_id, club_id):
+    backfill_subscriptions([user_id], club_id)
+
+
+def backfill_subscriptions(user_ids, club_id):
+    conn = connection()
+    with conn.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.exists(feed_ready_key(user_id))
+        ready = [user_id for user_id, exists in zip(user_ids, pipe.execute()) if exists]
+    if not ready:
+        return
+    upcoming = Event.objects.filter(club_id=club_id, start_date__gte=timezone.now()).order_by('start_date')
+    members = {event_member(pk): start.timestamp()
+               for pk, start in upcoming.values_list('id', 'start_date')[:settings.FEED_MAX_LENGTH]}
+    if members:
+        with conn.pipeline(transaction=False) as pipe:
+            for user_id in ready:
+                push(pipe, user_id, members)
+            pipe.execute()
+
+
+def remove_subscription(user_id, club_id):
+    remove_subscriptions([user_id], club_id)
+
+
+def remove_subscriptions(user_ids, club_id):
+    conn = connection()
+    # A feed that is not ready is rebuilt from subscriptions before it is read
+    with conn.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.exists(feed_ready_key(user_id))
+        ready = [user_id for user_id, exists in zip(user_ids, pipe.execute()) if exists]
+    if not ready:
+        return
+    members = conn.zrange(club_key(club_id), 0, -1)
+    upcoming = Event.objects.filter(club_id=club_id, start_date__gte=timezone.now())
+    members = set(members) | {event_member(pk).encode() for pk in upcoming.values_list('id', flat=True)}
+    if members:
+        with conn.pipeline(transaction=False) as pipe:
+            for user_id in ready:
+                pipe.zrem(feed_key(user_id), *members)
+            pipe.execute()
+
+
+def rebuild_feed(conn, user_id):
+    upcoming = Event.objects.filter(
+        club__subscribers__user_id=user_id, start_date__gte=timezone.now()
+    ).order_by('start_date')
+    members = {event_member(pk): start.timestamp()
+               for pk, start in upcoming.values_list('id', 'start_date')[:settings.FEED_MAX_LENGTH]}
+    with conn.pipeline() as pipe:
+        pipe.delete(feed_key(user_id))
+        if members:
+            push(pipe, user_id, members)
+        pipe.set(feed_ready_key(user_id), 1, ex=settings.FEED_TTL)
+        pipe.execute()
+
+
+def parse_cursor(cursor):
+    try:
+        score, member = cursor.split(':', 1)
+        score = float(score)
+    except (AttributeError, ValueError):
+        return None, None
+    # nan and inf parse as floats but ZRANGEBYSCORE rejects them
+    if not math.isfinite(score):
+        return None, None
+    return score, member.encode()
+
+
+def read_feed(user_id, cursor=None, limit=20):
+    """
+    Returns (event ids, next cursor) for one page of upcoming events ordered by
+    start time. The cursor is the score and member of the last event returned.
+    """
+    conn = connection()
+    if not conn.exists(feed_ready_key(user_id)):
+        rebuild_feed(conn, user_id)
+
+    keys = [feed_key(user_id)]
+    pull_clubs = conn.smembers(PULL_CLUBS_KEY)
+    if pull_clubs:
+        subscribed = Subscription.objects.filter(user_id=user_id, club_id__in=[int(pk) for pk in pull_clubs])
+        keys += [club_key(club_id) for club_id in subscribed.values_list('club_id', flat=True)]
+
+    score, member = parse_cursor(cursor)
+    if score is None:
+        score, member = timezone.now().timestamp(), None
+
+    with conn.pipeline(transaction=False) as pipe:
+        for key in keys:
+            if member is None:
+                pipe.zrangebyscore(key, score, '+inf', start=0, num=limit + 1, withscores=True)
+            else:
+                # Events sharing the cursor's start time come after it only if their id is larger
+                pipe.zrangebyscore(key, score, score, withscores=True)
+                pipe.zrangebyscore(key, f'({score}', '+inf', start=0, num=limit + 1, withscores=True)
+        results = pipe.execute()
+
+    entries = {}
+    for result in results:
+        for entry_member, entry_score in result:
+            if entry_score == score and member is not None and entry_member <= member:
+                continue
+            entries[entry_member] = entry_score
+    page = sorted(entries.items(), key=lambda item: (item[1], item[0]))[:limit + 1]
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        last_member, last_score = page[-1]
+        next_cursor = f'{last_score!r}:{last_member.decode()}'
+    return [int(entry_member) for entry_member, _ in page], next_cursor
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.http import HttpResponse
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Headers worth replaying; the rest are added again by middleware
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotentRequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed."
+    default_code = 'idempotency_in_progress'
+
+
+class IdempotentReplay(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def record_key(user_id, key):
+    return f'idempotency:{user_id}:{key}'
+
+
+def fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def replay(record):
+    response = HttpResponse(base64.b64decode(record['content']), status=record['status'])
+    for header, value in record['headers']:
+        response[header] = value
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+class IdempotencyMixin:
+    """
+    Lets clients retry the write methods in `idempotent_methods` safely by sending an
+    Idempotency-Key header. The first request with a key runs the handler and its
+    response is kept for IDEMPOTENCY_TTL; retries with the same key and body get that
+    response back, marked with Idempotent-Replayed. Keys are per user. Requests run
+    without the guarantee when Redis is unavailable.
+    """
+
+    idempotent_methods = ('POST',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._idempotency = None
+
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or request.method not in self.idempotent_methods or not request.user.is_authenticated:
+            return
+        if len(key) > 255:
+            raise ValidationError({IDEMPOTENCY_HEADER: "Keys are at most 255 characters."})
+
+        redis_key, request_fingerprint = record_key(request.user.pk, key), fingerprint(request._request)
+        try:
+            conn = get_redis_connection('default')
+            # Expires on its own if the handler dies without answering, so the client can retry
+            claimed = conn.set(redis_key, json.dumps({'fingerprint': request_fingerprint}), nx=True,
+                               ex=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            record = None if claimed else conn.get(redis_key)
+        except RedisError:
+            logger.warning("Idempotency store unavailable, handling request without it", exc_info=True)
+            return
+
+        if claimed:
+            self._idempotency = (redis_key, request_fingerprint)
+            return
+        record = json.loads(record) if record else {}
+        if record.get('fingerprint') != request_fingerprint:
+            raise IdempotencyKeyReused() if record else IdempotentRequestInProgress()
+        if 'status' not in record:
+            raise IdempotentRequestInProgress()
+        raise IdempotentReplay(replay(record))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentReplay):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, '_idempotency', None) is None:
+            return response
+
+        redis_key, request_fingerprint = self._idempotency
+        self._idempotency = None
+
+        def store(response):
+            try:
+                conn = get_redis_connection('default')
+                if response.status_code >= 500:
+                    # Server errors are not final; let the retry run the handler again
+                    conn.delete(redis_key)
+                    return
+                conn.set(redis_key, json.dumps({
+                    'fingerprint': request_fingerprint,
+                    'status': response.status_code,
+                    'content': base64.b64encode(response.content).decode(),
+                    'headers': [(name, response[name]) for name in REPLAYED_HEADERS if response.has_header(name)],
+                }), ex=settings.IDEMPOTENCY_TTL)
+            except RedisError:
+                logger.warning("Could not store idempotent response", exc_info=True)
+
+        if getattr(response, 'is_rendered', True):
+            store(response)
+        else:
+            response.add_post_render_callback(store)
+        return response
@@ -0,0 +1,214 @@
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from core.analytics import DELTAS, SOURCES, update_rollup
+from core.metrics import MAINTENANCE_DURATION, MAINTENANCE_ROWS
+from core.models import EmailVerification, Event, EventDailyStats, MaintenanceCheckpoint, RollupWatermark
+from core.partitions import current_term, ensure_ticket_partitions
+
+logger = logging.getLogger(__name__)
+
+# A job runs only while it holds its lease. The lease is renewed after every batch,
+# and only while it still holds this run's token, so a run that stalled past its
+# lease and lost it to another worker stops instead of running alongside it.
+EXTEND = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class MaintenanceJob:
+    name: str
+    # batch(cursor, limit) -> (rows processed, next cursor or None once the pass is done)
+    batch: Callable
+    batch_size: int
+    # Seconds; must outlast a single batch
+    lease: int
+
+
+JOBS = {}
+
+
+def maintenance_job(name, batch_size=1000, lease=300):
+    """Registers a batch function as a job that core.tasks.run_maintenance can run."""
+    def register(batch):
+        JOBS[name] = MaintenanceJob(name, batch, batch_size, lease)
+        return batch
+    return register
+
+
+class Lease:
+    def __init__(self, conn, name, seconds):
+        self.conn = conn
+        self.key = f'maintenance:lease:{name}'
+        self.token = uuid.uuid4().hex
+        self.ttl = seconds * 1000
+
+    def acquire(self):
+        return bool(self.conn.set(self.key, self.token, nx=True, px=self.ttl))
+
+    def extend(self):
+        return bool(self.conn.register_script(EXTEND)(keys=[self.key], args=[self.token, self.ttl]))
+
+    def release(self):
+        self.conn.register_script(RELEASE)(keys=[self.key], args=[self.token])
+
+
+def run_job(name):
+    """
+    Runs batches of a registered job from its checkpoint until the pass is done or
+    MAINTENANCE_MAX_RUNTIME has passed; the next run resumes from the checkpoint.
+    Returns the rows processed, or None when the job is already running elsewhere.
+    """
+    job = JOBS[name]
+    try:
+        lease = Lease(get_redis_connection('default'), name, job.lease)
+        if not lease.acquire():
+            logger.info("Maintenance job %s is already running, skipping", name)
+            return None
+    except RedisError:
+        # Without the lease two runs could overlap, so skip until Redis is back
+        logger.warning("Maintenance job %s skipped, lease unavailable", name, exc_info=True)
+        return None
+
+    started = time.monotonic()
+    checkpoint, _ = MaintenanceCheckpoint.objects.get_or_create(name=name)
+    processed, outcome = 0, 'failed'
+    try:
+        while True:
+            with transaction.atomic():
+                if checkpoint.cursor is None:
+                    checkpoint.pass_started_at = timezone.now()
+                count, checkpoint.cursor = job.batch(checkpoint.cursor, job.batch_size)
+                # Committed with the batch, so a restarted worker neither skips nor repeats it
+                checkpoint.save(update_fields=['cursor', 'pass_started_at'])
+            processed += count
+
+            if checkpoint.cursor is None:
+                outcome = 'completed'
+                checkpoint.completed_at = timezone.now()
+                break
+            if time.monotonic() - started >= settings.MAINTENANCE_MAX_RUNTIME:
+                outcome = 'partial'
+                break
+            if not lease.extend():
+                outcome = 'lost_lease'
+                logger.warning("Maintenance job %s lost its lease, stopping", name)
+                break
+    finally:
+        runtime = time.monotonic() - started
+        checkpoint.last_run_at = timezone.now()
+        checkpoint.last_outcome = outcome
+        checkpoint.last_runtime = runtime
+        checkpoint.last_processed = processed
+        checkpoint.save(update_fields=['completed_at', 'last_run_at', 'last_outcome', 'last_runtime',
+                                       'last_processed'])
+        MAINTENANCE_DURATION.labels(name, outcome).observe(runtime)
+        MAINTENANCE_ROWS.labels(name).inc(processed)
+        logger.info("Maintenance job %s %s: %s rows in %.2fs", name, outcome, processed, runtime)
+        try:
+            lease.release()
+        except RedisError:
+            logger.warning("Could not release lease of maintenance job %s", name, exc_info=True)
+    return processed
+
+
+@maintenance_job('expire_verifications')
+def expire_verifications(cursor, limit):
+    """Marks pending email verifications past their expiration as expired."""
+    ids = list(EmailVerification.objects.filter(
+        status=EmailVerification.Status.PENDING, expiration__lt=timezone.now(), pk__gt=cursor or 0,
+    ).order_by('pk').values_list('pk', flat=True)[:limit])
+    EmailVerification.objects.filter(pk__in=ids, status=EmailVerification.Status.PENDING).update(
+        status=EmailVerification.Status.EXPIRED
+    )
+    return len(ids), ids[-1] if len(ids) == limit else None
+
+
+@maintenance_job('refresh_rollups')
+def refresh_rollups(cursor, limit):
+    """
+    Rolls up one batch per source that is still behind; the cursor lists those
+    sources. Rollups keep their own watermarks and ROLLUP_BATCH_SIZE, so `limit`
+    is not used.
+    """
+    read, behind = 0, []
+    for name in cursor or SOURCES:
+        count = update_rollup(name)
+        read += count
+        if count >= settings.ROLLUP_BATCH_SIZE:
+            behind.append(name)
+    return read, behind or None
+
+
+ROLLUP_FIELDS = ('tickets_sold', 'revenue', 'reviews', 'rating_sum')
+
+
+@maintenance_job('reconcile_rollups', batch_size=500)
+def reconcile_rollups(cursor, limit):
+    """
+    Recounts the rollup rows of a batch of events from the tickets and reviews
+    behind the watermarks, and rewrites rows that drifted, e.g. after a missed
+    cancellation. Revenue is recounted at the current ticket price.
+    """
+    events = list(Event.objects.filter(pk__gt=cursor or 0).order_by('pk').values_list('pk', flat=True)[:limit])
+    if not events:
+        return 0, None
+
+    # Locked as update_rollup() locks them, so no rollup moves while rows are recounted
+    positions = dict(RollupWatermark.objects.select_for_update().filter(name__in=SOURCES).values_list(
+        'name', 'position'
+    ))
+    expected = {}
+    for name, (model, field, _) in SOURCES.items():
+        if positions.get(name) is None:
+            continue
+        rows = model.objects.filter(event_id__in=events, **{f'{field}__lte': positions[name]})
+        for key, (club_id, values) in DELTAS[name](rows).items():
+            expected.setdefault(key, (club_id, {}))[1].update(values)
+
+    current = {(row.event_id, row.day): row for row in EventDailyStats.objects.filter(event_id__in=events)}
+    drifted = []
+    for key in current.keys() | expected.keys():
+        club_id, values = expected.get(key, (None, {}))
+        row = current.get(key) or EventDailyStats(club_id=club_id, event_id=key[0], day=key[1])
+        counted = {field: values.get(field, 0) for field in ROLLUP_FIELDS}
+        if any(getattr(row, field) != value for field, value in counted.items()):
+            for field, value in counted.items():
+                setattr(row, field, value)
+            drifted.append(row)
+
+    if drifted:
+        logger.info("Reconciled %s rollup rows", len(drifted))
+        EventDailyStats.objects.bulk_create(
+            drifted,
+            update_conflicts=True,
+            unique_fields=['event', 'day'],
+            update_fields=list(ROLLUP_FIELDS),
+        )
+    return len(events), events[-1] if len(events) == limit else None
+
+
+@maintenance_job('ticket_partitions')
+def ticket_partitions(cursor, limit):
+    """Creates ticket partitions for the current term and the next TICKET_TERMS_AHEAD."""
+    term = current_term()
+    return ensure_ticket_partitions(range(term, term + settings.TICKET_TERMS_AHEAD + 1)), None
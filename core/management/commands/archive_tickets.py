@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.partitions import archive_ticket_terms, current_term, is_partitioned, term_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves tickets to events older than the last --keep academic terms into the archive partition '
+        'of core_ticket. PostgreSQL only; ticket reads and writes wait while it runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=settings.TICKET_HOT_TERMS,
+                            help='Recent terms, the current one included, to keep in their own partitions.')
+
+    def handle(self, *args, **options):
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1.')
+        if not is_partitioned():
+            self.stdout.write('core_ticket is not partitioned on this database; nothing to archive.')
+            return
+
+        before = current_term() - options['keep'] + 1
+        moved = archive_ticket_terms(before)
+        for term, count in moved.items():
+            self.stdout.write(f'Term {term} (from {term_start(term)}): {count} tickets archived')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {sum(moved.values())} tickets from {len(moved)} terms; archive now ends at {term_start(before)}'
+        ))
@@ -0,0 +1,257 @@
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Student, Club, ClubMember, Room, Event, Ticket, Subscription, EventReview
+from core.partitions import academic_term, ensure_ticket_partitions
+
+FACULTIES = ['FEENS', 'EDU', 'LAW', 'BS']
+SPECIALITIES = ['Computer Science', 'Mathematics', 'Economics', 'History', 'Law', 'Design', 'Physics']
+ROOM_CAPACITIES = [30, 60, 120, 300, 800]
+RATINGS = [1, 2, 3, 4, 5]
+RATING_WEIGHTS = [5, 8, 17, 35, 35]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def zipf_weights(count, exponent=1.1):
+    # A handful of clubs get most of the members, events and subscribers
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def copy_text(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic dataset at production scale for load and performance testing. '
+        'Only --copy keeps the generated timestamps; bulk_create stamps auto_now_add fields with the current time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=20000)
+        parser.add_argument('--clubs', type=int, default=200)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--events', type=int, default=5000)
+        parser.add_argument('--tickets', type=int, default=200000)
+        parser.add_argument('--memberships', type=int, default=40000)
+        parser.add_argument('--subscriptions', type=int, default=100000)
+        parser.add_argument('--reviews', type=int, default=50000)
+        parser.add_argument('--sold-out-ratio', type=float, default=0.1,
+                            help='Share of events whose capacity equals the tickets generated for them.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--copy', action='store_true', help='Load rows with PostgreSQL COPY instead of bulk_create.')
+        parser.add_argument('--prefix', default='load', help='Prefix for generated usernames and names.')
+        parser.add_argument('--password', default='loadtest123', help='Password shared by every generated student.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset.')
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy requires PostgreSQL.')
+        if options['students'] < 1 or options['clubs'] < 1:
+            raise CommandError('At least one student and one club are required.')
+
+        self.prefix = options['prefix']
+        if Student.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f'Data with prefix "{self.prefix}" already exists; pass a different --prefix.')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.use_copy = options['copy']
+        self.now = timezone.now()
+        started = time.monotonic()
+
+        with transaction.atomic():
+            students = self.load_students(options['students'], options['password'])
+            clubs = self.load_clubs(options['clubs'])
+            rooms = self.load_rooms(options['rooms'])
+            club_weights = zipf_weights(len(clubs))
+
+            self.load_memberships(options['memberships'], students, clubs, club_weights)
+            self.load_subscriptions(options['subscriptions'], students, clubs, club_weights)
+            events = self.load_events(options['events'], options['tickets'], options['sold_out_ratio'],
+                                      students, clubs, rooms, club_weights)
+            reviews = self.load_tickets(events, students, options['reviews'])
+            self.load(EventReview, reviews)
+
+        if connection.vendor == 'postgresql':
+            tables = ', '.join(model._meta.db_table for model in
+                               (Student, Club, ClubMember, Room, Event, Ticket, Subscription, EventReview))
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {tables}')
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.monotonic() - started:.1f}s'))
+
+    def load(self, model, objects, queryset=None):
+        started = time.monotonic()
+        written = 0
+        for batch in batched(objects, self.batch_size):
+            if self.use_copy:
+                self.copy(model, batch)
+            else:
+                model.objects.bulk_create(batch)
+            written += len(batch)
+        self.stdout.write(f'{model.__name__}: {written} rows in {time.monotonic() - started:.1f}s')
+
+        if queryset is not None:
+            return list(queryset.order_by('pk').values_list('pk', flat=True))
+
+    def copy(self, model, objects):
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        buffer = io.StringIO()
+        for obj in objects:
+            buffer.write('\t'.join(
+                copy_text(field.get_db_prep_save(field.pre_save(obj, False), connection)) for field in fields
+            ))
+            buffer.write('\n')
+
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor, cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+            copy.write(buffer.getvalue())
+
+    def load_students(self, count, password):
+        # Hashing once instead of per row is what makes large student counts feasible
+        password_hash = make_password(password)
+        rng = self.rng
+        students = (
+            Student(
+                username=f'{self.prefix}_student_{i}',
+                email=f'{self.prefix}_student_{i}@example.com',
+                password=password_hash,
+                faculty=rng.choice(FACULTIES),
+                speciality=rng.choice(SPECIALITIES),
+                wallet_balance=Decimal(rng.randrange(0, 50000)),
+                is_email_verified=True,
+                date_joined=self.now - timedelta(days=rng.uniform(0, 1000)),
+            )
+            for i in range(count)
+        )
+        return self.load(Student, students, Student.objects.filter(username__startswith=f'{self.prefix}_student_'))
+
+    def load_clubs(self, count):
+        clubs = (
+            Club(name=f'{self.prefix} club {i}', description=f'Synthetic club #{i}',
+                 created_at=self.now - timedelta(days=self.rng.uniform(30, 1500)))
+            for i in range(count)
+        )
+        return self.load(Club, clubs, Club.objects.filter(name__startswith=f'{self.prefix} club '))
+
+    def load_rooms(self, count):
+        rooms = (
+            Room(name=f'{self.prefix} room {i}', capacity=self.rng.choice(ROOM_CAPACITIES))
+            for i in range(count)
+        )
+        return self.load(Room, rooms, Room.objects.filter(name__startswith=f'{self.prefix} room '))
+
+    def unique_pairs(self, count, students, clubs, club_weights, taken=()):
+        rng = self.rng
+        cum_weights = list(accumulate(club_weights))
+        seen = set(taken)
+        attempts = 0
+        while len(seen) < count + len(taken) and attempts < count * 3:
+            attempts += 1
+            pair = (rng.randrange(len(students)), rng.choices(range(len(clubs)), cum_weights=cum_weights)[0])
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+
+    def load_memberships(self, count, students, clubs, club_weights):
+        heads = [(self.rng.randrange(len(students)), club) for club in range(len(clubs))]
+        members = self.unique_pairs(max(count - len(heads), 0), students, clubs, club_weights, taken=heads)
+
+        def build():
+            for student, club in heads:
+                yield ClubMember(user_id=students[student], club_id=clubs[club], role=ClubMember.RoleChoices.HEAD,
+                                 joined_at=self.now)
+            for student, club in members:
+                yield ClubMember(user_id=students[student], club_id=clubs[club],
+                                 joined_at=self.now - timedelta(days=self.rng.uniform(0, 700)))
+
+        self.load(ClubMember, build())
+
+    def load_subscriptions(self, count, students, clubs, club_weights):
+        subscriptions = (
+            Subscription(user_id=students[student], club_id=clubs[club],
+                         subscribed_at=self.now - timedelta(days=self.rng.uniform(0, 700)))
+            for student, club in self.unique_pairs(count, students, clubs, club_weights)
+        )
+        self.load(Subscription, subscriptions)
+
+    def load_events(self, count, tickets, sold_out_ratio, students, clubs, rooms, club_weights):
+        rng = self.rng
+        hosts = rng.choices(range(len(clubs)), weights=club_weights, k=count)
+        popularity = [club_weights[club] * rng.lognormvariate(0, 0.75) for club in hosts]
+        scale = tickets / sum(popularity) if popularity else 0
+        # Tickets each event will get; an event can't sell more tickets than there are students
+        self.ticket_targets = [min(round(weight * scale), len(students)) for weight in popularity]
+
+        def build():
+            for i, (club, sold) in enumerate(zip(hosts, self.ticket_targets)):
+                start = self.now + timedelta(days=rng.uniform(-365, 90))
+                paid = rng.random() < 0.3
+                if rng.random() < sold_out_ratio:
+                    capacity = max(sold, 1)
+                else:
+                    capacity = sold + max(1, int(sold * rng.uniform(0.1, 1.0)))
+                yield Event(
+                    title=f'{self.prefix} event {i}',
+                    description=f'Synthetic event #{i}',
+                    club_id=clubs[club],
+                    room_id=rng.choice(rooms) if rooms else None,
+                    start_date=start,
+                    end_date=start + timedelta(hours=rng.choice([1, 2, 3])),
+                    ticket_price=Decimal(rng.randrange(5, 50) * 100) if paid else Decimal(0),
+                    total_tickets=capacity,
+                    created_at=start - timedelta(days=rng.uniform(7, 60)),
+                    ticket_type=Event.TicketTypeChoices.PAID if paid else Event.TicketTypeChoices.FREE,
+                )
+
+        self.events = list(build())
+        return self.load(Event, self.events, Event.objects.filter(title__startswith=f'{self.prefix} event '))
+
+    def load_tickets(self, events, students, review_count):
+        rng = self.rng
+        past = [event.start_date < self.now for event in self.events]
+        past_tickets = sum(sold for sold, done in zip(self.ticket_targets, past) if done)
+        review_chance = min(1.0, review_count / past_tickets) if past_tickets else 0
+        reviews = []
+
+        def build():
+            for event_id, event, sold, done in zip(events, self.events, self.ticket_targets, past):
+                window = (event.start_date - event.created_at).total_seconds()
+                term = academic_term(event.start_date)
+                for student in rng.sample(range(len(students)), sold):
+                    yield Ticket(student_id=students[student], event_id=event_id, term=term,
+                                 purchased_at=event.created_at + timedelta(seconds=rng.uniform(0, window)))
+                    # Only people who went to a past event review it
+                    if done and len(reviews) < review_count and rng.random() < review_chance:
+                        reviews.append(EventReview(
+                            event_id=event_id, user_id=students[student],
+                            rating=rng.choices(RATINGS, weights=RATING_WEIGHTS)[0],
+                            created_at=event.end_date + timedelta(hours=rng.uniform(1, 72)),
+                        ))
+
+        # Events were bulk loaded without post_save, which creates their ticket partitions
+        ensure_ticket_partitions({academic_term(event.start_date) for event in self.events})
+        self.load(Ticket, build())
+        return reviews
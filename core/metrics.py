@@ -0,0 +1,166 @@
+import os
+import time
+
+from celery.signals import task_postrun, task_prerun, worker_init
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# With several gunicorn workers each process writes its samples to
+# PROMETHEUS_MULTIPROC_DIR and the scrape aggregates them, so nothing here
+# needs a lock shared between processes.
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency by route.',
+    ['route', 'method'],
+)
+REQUESTS = Counter(
+    'http_requests_total',
+    'Requests by route and response status.',
+    ['route', 'method', 'status'],
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Database queries executed per request.',
+    ['route', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233),
+)
+DB_DURATION = Histogram(
+    'http_request_db_duration_seconds',
+    'Time spent in database queries per request.',
+    ['route', 'method'],
+)
+THROTTLED = Counter(
+    'http_requests_throttled_total',
+    'Requests rejected by throttling.',
+    ['route'],
+)
+PAGE_CACHE = Counter(
+    'page_cache_requests_total',
+    'Page cache lookups by cache key prefix: hit, miss, stale (rebuilt after invalidation or expiry), '
+    'early (rebuilt ahead of expiry), stale_served (stale copy served during a rebuild) or waited.',
+    ['cache', 'result'],
+)
+CACHE_TIER = Counter(
+    'cache_tier_requests_total',
+    'Lookups of locally cached keys by tier: the process LRU, then Redis on a local miss.',
+    ['tier', 'result'],
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds',
+    'Celery task run time.',
+    ['task', 'state'],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+MAINTENANCE_DURATION = Histogram(
+    'maintenance_job_duration_seconds',
+    'Run time of periodic maintenance jobs by outcome: completed, partial (resumes next run), '
+    'lost_lease or failed.',
+    ['job', 'outcome'],
+    buckets=(.1, .5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+MAINTENANCE_ROWS = Counter(
+    'maintenance_job_rows_total',
+    'Rows processed by periodic maintenance jobs.',
+    ['job'],
+)
+
+
+def route_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name
+
+
+class QueryObserver:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class CeleryQueueCollector:
+    """Reads queue depth from the broker at scrape time."""
+
+    def collect(self):
+        from sxodimsdu.celery import app
+
+        gauge = GaugeMetricFamily('celery_queue_length', 'Messages waiting in a Celery queue.', labels=['queue'])
+        names = [app.conf.task_default_queue]
+        names += [queue.name for queue in app.conf.task_queues or () if queue.name not in names]
+        try:
+            with app.connection_for_read() as conn:
+                channel = conn.default_channel
+                for name in names:
+                    _, size, _ = channel.queue_declare(queue=name, passive=True)
+                    gauge.add_metric([name], size)
+        except Exception:
+            # An unreachable broker must not break the scrape.
+            pass
+        yield gauge
+
+
+_queue_registry = CollectorRegistry(auto_describe=False)
+_queue_registry.register(CeleryQueueCollector())
+
+
+def scrape_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # Without a token the endpoint is only open in development
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+
+    output = generate_latest(scrape_registry()) + generate_latest(_queue_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_DURATION.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started)
+
+
+@worker_init.connect
+def _start_worker_metrics_server(**kwargs):
+    # Worker processes live in their own container, so they publish task
+    # metrics on a separate port instead of through the web /metrics view.
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=scrape_registry())
@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import logging
+import time
+from contextlib import ExitStack
+
+import brotli
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from core.db_router import reset_read_routing, route_reads_to_replica, stick_to_primary
+from core.metrics import DB_DURATION, DB_QUERIES, REQUEST_LATENCY, REQUESTS, THROTTLED, QueryObserver, route_label
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        observer = QueryObserver()
+        start = time.perf_counter()
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(observer))
+            response = self.get_response(request)
+
+        route = route_label(request)
+        method = request.method
+        REQUEST_LATENCY.labels(route, method).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, method, response.status_code).inc()
+        DB_QUERIES.labels(route, method).observe(observer.count)
+        DB_DURATION.labels(route, method).observe(observer.duration)
+        if response.status_code == 429:
+            THROTTLED.labels(route).inc()
+
+        return response
+
+
+def parse_accept_encoding(header):
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Brotli or gzip for responses above COMPRESSION_MIN_SIZE, whichever the client prefers.
+    Brotli wins a tie since it is smaller at the same CPU cost with a low quality setting.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        brotli_q = accepted.get('br', 0)
+        gzip_q = accepted.get('gzip', accepted.get('*', 0))
+        if brotli_q <= 0 and gzip_q <= 0:
+            return response
+
+        if brotli_q >= gzip_q:
+            encoding = 'br'
+            compressed = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            encoding = 'gzip'
+            compressed = gzip.compress(response.content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag no longer matches the encoded bytes
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
+
+
+REPLICA_PIN_COOKIE = 'db_pin'
+
+
+def replica_pin_key(request):
+    # Token clients rarely keep cookies, so they are pinned by their Authorization header
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return 'db_pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+    return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Safe requests to views with read_from_replica = True read from DATABASE_REPLICAS
+    until they write to the primary. A client that sent a write in the last REPLICA_PIN_SECONDS reads from the primary,
+    so it sees its own writes despite replication lag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = route_reads_to_replica(False)
+        try:
+            with ExitStack() as stack:
+                if settings.DATABASE_REPLICAS:
+                    stack.enter_context(connections['default'].execute_wrapper(stick_to_primary))
+                response = self.get_response(request)
+        finally:
+            reset_read_routing(token)
+
+        if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+            key = replica_pin_key(request)
+            if key:
+                try:
+                    cache.set(key, 1, settings.REPLICA_PIN_SECONDS)
+                except Exception:
+                    logger.warning("Could not pin client to the primary database", exc_info=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and getattr(view_class, 'read_from_replica', False)
+            and not self.pinned(request)
+        ):
+            route_reads_to_replica(True)
+
+    def pinned(self, request):
+        if REPLICA_PIN_COOKIE in request.COOKIES:
+            return True
+        key = replica_pin_key(request)
+        if key is None:
+            return False
+        try:
+            return bool(cache.get(key))
+        except Exception:
+            # Without the pin store the primary is the only safe choice
+            logger.warning("Could not read database pin", exc_info=True)
+            return True
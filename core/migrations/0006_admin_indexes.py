@@ -0,0 +1,81 @@
+# Generated by Django 5.2 on 2026-10-19 06:37
+
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+# Admin search runs UPPER(column) LIKE UPPER('%term%'), which only a trigram index on
+# the same expression can serve. Plain SQL so the migration still runs on SQLite.
+TRIGRAM_INDEXES = [
+    ('core_student_username_trgm', 'core_student', 'username'),
+    ('core_student_email_trgm', 'core_student', 'email'),
+    ('core_club_name_trgm', 'core_club', 'name'),
+    ('core_room_name_trgm', 'core_room', 'name'),
+    ('core_event_title_trgm', 'core_event', 'title'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """
+    The B-tree indexes go on tables with millions of rows, so on PostgreSQL they are
+    built without locking out writes. Other backends get a plain CREATE INDEX.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_alter_emailverification_expiration'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='clubmember',
+            index=models.Index(fields=['role'], name='core_clubmember_role_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='event',
+            index=models.Index(fields=['start_date'], name='core_event_start_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='event',
+            index=models.Index(fields=['ticket_type', '-start_date'], name='core_event_type_start_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='eventreview',
+            index=models.Index(fields=['rating'], name='core_eventreview_rating_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='ticket',
+            index=models.Index(fields=['purchased_at'], name='core_ticket_purchased_idx'),
+        ),
+    ]
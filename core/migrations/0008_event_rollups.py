@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 06:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_checkin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('tickets_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('reviews', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.club')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['club', 'day'], name='core_eventdailystats_club_idx')],
+                'constraints': [models.UniqueConstraint(fields=('event', 'day'), name='core_eventdailystats_event_day')],
+            },
+        ),
+    ]
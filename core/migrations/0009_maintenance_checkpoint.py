@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-19 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_event_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('cursor', models.JSONField(blank=True, null=True)),
+                ('pass_started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_outcome', models.CharField(blank=True, max_length=20)),
+                ('last_runtime', models.FloatField(blank=True, null=True)),
+                ('last_processed', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# PostgreSQL only: core_ticket is rebuilt as a table range-partitioned by term, with
+# one partition per term that has events and an empty archive partition below them.
+# The partition key has to be part of every unique constraint, so the primary key
+# becomes (id, term) and the one-ticket-per-student rule (student, event, term), which
+# is the same rule since an event has a single term. The rows are copied while the
+# migration holds the table.
+COLUMNS = 'id, purchased_at, event_id, student_id, term'
+
+# Frozen copies of ACADEMIC_TERM_START_MONTHS, TICKET_TERMS_AHEAD and
+# core.partitions.academic_term as they were when this migration was written
+TERM_START_MONTHS = (1, 8)
+TERMS_AHEAD = 2
+
+
+def academic_term(value):
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.year * len(TERM_START_MONTHS) + sum(value.month >= month for month in TERM_START_MONTHS) - 1
+
+
+UNIQUE = ('student', 'event')
+PARTITIONED_UNIQUE = ('student', 'event', 'term')
+
+
+def fill_terms(apps, schema_editor):
+    Event = apps.get_model('core', 'Event')
+    Ticket = apps.get_model('core', 'Ticket')
+    events = {}
+    for pk, start_date in Event.objects.values_list('pk', 'start_date').iterator():
+        events.setdefault(academic_term(start_date), []).append(pk)
+    for term, pks in events.items():
+        for start in range(0, len(pks), 1000):
+            Ticket.objects.filter(event_id__in=pks[start:start + 1000]).update(term=term)
+
+
+def constraints(schema_editor, primary_key, unique):
+    schema_editor.execute(f'ALTER TABLE core_ticket ADD CONSTRAINT core_ticket_pkey PRIMARY KEY ({primary_key})')
+    schema_editor.execute(f'ALTER TABLE core_ticket ADD CONSTRAINT core_ticket_student_event_uniq UNIQUE ({unique})')
+    for column, table in (('event_id', 'core_event'), ('student_id', 'core_student')):
+        schema_editor.execute(
+            f'ALTER TABLE core_ticket ADD CONSTRAINT core_ticket_{column}_fk FOREIGN KEY ({column}) '
+            f'REFERENCES {table} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        schema_editor.execute(f'CREATE INDEX core_ticket_{column}_idx ON core_ticket ({column})')
+    schema_editor.execute('CREATE INDEX core_ticket_purchased_idx ON core_ticket (purchased_at)')
+
+
+def replace_table(schema_editor, create):
+    """Copies core_ticket into a table made by `create` and swaps it in under the same name and sequence."""
+    execute = schema_editor.execute
+    create('core_ticket_new')
+    execute(f'INSERT INTO core_ticket_new ({COLUMNS}) SELECT {COLUMNS} FROM core_ticket')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM core_ticket')
+        next_id, = cursor.fetchone()
+    execute('DROP TABLE core_ticket')
+    execute('ALTER TABLE core_ticket_new RENAME TO core_ticket')
+    execute('CREATE SEQUENCE core_ticket_id_seq OWNED BY core_ticket.id')
+    execute(f"SELECT setval('core_ticket_id_seq', {next_id}, false)")
+    execute("ALTER TABLE core_ticket ALTER COLUMN id SET DEFAULT nextval('core_ticket_id_seq')")
+
+
+def partition_tickets(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        # A plain table only takes the unique constraint recorded in the state
+        schema_editor.alter_unique_together(apps.get_model('core', 'Ticket'), [UNIQUE], [PARTITIONED_UNIQUE])
+        return
+    Event = apps.get_model('core', 'Event')
+    starts = Event.objects.values_list('start_date', flat=True).iterator()
+    terms = {academic_term(start_date) for start_date in starts}
+    current = academic_term(timezone.now())
+    terms.update(range(current, current + TERMS_AHEAD + 1))
+
+    def create(name):
+        schema_editor.execute(f'CREATE TABLE {name} (LIKE core_ticket INCLUDING DEFAULTS) PARTITION BY RANGE (term)')
+        schema_editor.execute(f'CREATE TABLE core_ticket_archive PARTITION OF {name} '
+                              f'FOR VALUES FROM (MINVALUE) TO ({min(terms)})')
+        for term in sorted(terms):
+            schema_editor.execute(f'CREATE TABLE core_ticket_t{term} PARTITION OF {name} '
+                                  f'FOR VALUES FROM ({term}) TO ({term + 1})')
+
+    replace_table(schema_editor, create)
+    constraints(schema_editor, 'id, term', 'student_id, event_id, term')
+
+
+def unpartition_tickets(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.alter_unique_together(apps.get_model('core', 'Ticket'), [PARTITIONED_UNIQUE], [UNIQUE])
+        return
+    # Detached from the old table so dropping it keeps the sequence
+    schema_editor.execute('ALTER SEQUENCE core_ticket_id_seq OWNED BY NONE')
+    schema_editor.execute('ALTER SEQUENCE core_ticket_id_seq RENAME TO core_ticket_id_seq_old')
+
+    def create(name):
+        schema_editor.execute(f'CREATE TABLE {name} (LIKE core_ticket)')
+
+    replace_table(schema_editor, create)
+    schema_editor.execute('DROP SEQUENCE core_ticket_id_seq_old')
+    constraints(schema_editor, 'id', 'student_id, event_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_maintenance_checkpoint'),
+    ]
+
+    operations = [
+        # A partitioned core_ticket cannot be the target of a foreign key on id alone
+        migrations.AlterField(
+            model_name='checkin',
+            name='ticket',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE,
+                                       related_name='check_in', to='core.ticket'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='term',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_terms, migrations.RunPython.noop),
+        # Django keeps id as the primary key in the state, since CheckIn.ticket cannot
+        # point at (id, term); ids stay unique through the shared sequence
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(partition_tickets, unpartition_tickets)],
+            state_operations=[
+                migrations.AlterUniqueTogether(name='ticket', unique_together={PARTITIONED_UNIQUE}),
+            ],
+        ),
+    ]
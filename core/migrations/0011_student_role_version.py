@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_partition_tickets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='role_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
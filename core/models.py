@@ -4,12 +4,23 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from core.tasks import send_verification_email
 
+from core.partitions import academic_term, first_hot_term, term_expression
 from core.storage_backends import ClubLogoStorage, RoomImageStorage, EventImageStorage
 from django.utils.timezone import timezone, now
 import uuid
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+
+def count_subquery(queryset, field):
+    """COUNT of `queryset` rows whose `field` points at the outer row, for annotate()."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts), 0)
 
 
 class Student(AbstractUser):
@@ -17,6 +28,18 @@ class Student(AbstractUser):
     speciality = models.CharField(max_length=100)
     wallet_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     is_email_verified = models.BooleanField(default=False)
+    # Bumped whenever staff, active or head club status changes; access tokens carry
+    # the version they were issued at (core/authentication.py)
+    role_version = models.PositiveIntegerField(default=0, editable=False)
+
+
+class ClubQuerySet(models.QuerySet):
+    def with_counts(self):
+        return self.annotate(
+            num_members=count_subquery(ClubMember.objects.all(), 'club'),
+            num_subscribers=count_subquery(Subscription.objects.all(), 'club'),
+            num_upcoming_events=count_subquery(Event.objects.filter(start_date__gte=Now()), 'club'),
+        )
 
 
 class Club(models.Model):
@@ -30,9 +53,31 @@ class Club(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ClubQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    # Lists annotate these via with_counts(); a single instance falls back to counting
+
+    @property
+    def member_count(self):
+        if hasattr(self, 'num_members'):
+            return self.num_members
+        return self.members.count()
+
+    @property
+    def subscriber_count(self):
+        if hasattr(self, 'num_subscribers'):
+            return self.num_subscribers
+        return self.subscribers.count()
+
+    @property
+    def upcoming_event_count(self):
+        if hasattr(self, 'num_upcoming_events'):
+            return self.num_upcoming_events
+        return self.events.filter(start_date__gte=now()).count()
+
 
 class ClubMember(models.Model):
     class RoleChoices(models.TextChoices):
@@ -46,6 +91,7 @@ class ClubMember(models.Model):
 
     class Meta:
         unique_together = ('user', 'club')
+        indexes = [models.Index(fields=['role'], name='core_clubmember_role_idx')]
 
     def __str__(self):
         return f"{self.user} in {self.club} as {self.role}"
@@ -66,6 +112,14 @@ class Room(models.Model):
         return f"{self.name} ({self.capacity} seats)"
 
 
+class EventQuerySet(models.QuerySet):
+    def with_ticket_counts(self):
+        # Counted on the event's term too, so PostgreSQL reads one ticket partition per event
+        return self.annotate(ticket_term=term_expression('start_date')).annotate(
+            sold_ticket_count=count_subquery(Ticket.objects.filter(term=OuterRef('ticket_term')), 'event')
+        )
+
+
 class Event(models.Model):
     class TicketTypeChoices(models.TextChoices):
         FREE = 'free', 'Free'
@@ -89,32 +143,94 @@ class Event(models.Model):
     ticket_type = models.CharField(max_length=10, choices=TicketTypeChoices.choices,
                                    default=TicketTypeChoices.FREE)
 
+    objects = EventQuerySet.as_manager()
+
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            models.Index(fields=['start_date'], name='core_event_start_idx'),
+            models.Index(fields=['ticket_type', '-start_date'], name='core_event_type_start_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
     @property
     def tickets_sold(self):
-        return self.tickets.count()
+        # Lists annotate the count via with_ticket_counts() to avoid a query per row
+        if hasattr(self, 'sold_ticket_count'):
+            return self.sold_ticket_count
+        return Ticket.objects.for_event(self).count()
 
     @property
     def tickets_available(self):
         return self.total_tickets - self.tickets_sold
 
 
+class TicketQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        fill_terms(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def for_event(self, event):
+        """Tickets to an event or event id, filtered on its term so PostgreSQL reads one partition."""
+        if isinstance(event, Event):
+            return self.filter(event_id=event.pk, term=academic_term(event.start_date))
+        term = Event.objects.filter(pk=event).annotate(term=term_expression('start_date')).values('term')[:1]
+        return self.filter(event_id=event, term=Subquery(term))
+
+    def hot(self):
+        """Tickets to events of the last TICKET_HOT_TERMS terms and later."""
+        return self.filter(term__gte=first_hot_term())
+
+
 class Ticket(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='tickets')
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='tickets')
     purchased_at = models.DateTimeField(auto_now_add=True)
+    # Academic term of the event, which core_ticket is partitioned by (core.partitions)
+    term = models.PositiveSmallIntegerField(editable=False)
+
+    objects = TicketQuerySet.as_manager()
 
     class Meta:
-        unique_together = ('student', 'event')
+        # The partition key has to be in every unique constraint; an event has a single
+        # term, so this is still one ticket per student and event
+        unique_together = ('student', 'event', 'term')
+        indexes = [models.Index(fields=['purchased_at'], name='core_ticket_purchased_idx')]
 
     def __str__(self):
         return f"Ticket for {self.student} to {self.event}"
 
+    def save(self, *args, **kwargs):
+        fill_terms([self])
+        super().save(*args, **kwargs)
+
+
+def fill_terms(tickets):
+    """Sets the term of tickets that have none, with one query for events not loaded yet."""
+    missing = [ticket for ticket in tickets if ticket.term is None]
+    unloaded = {ticket.event_id for ticket in missing if not Ticket.event.is_cached(ticket)}
+    starts = dict(Event.objects.filter(pk__in=unloaded).values_list('pk', 'start_date')) if unloaded else {}
+    for ticket in missing:
+        start = ticket.event.start_date if Ticket.event.is_cached(ticket) else starts[ticket.event_id]
+        ticket.term = academic_term(start)
+
+
+class CheckIn(models.Model):
+    # One row per ticket; later scans of the same ticket are duplicates. Ticket ids are
+    # only unique together with the term on a partitioned core_ticket, so PostgreSQL
+    # cannot hold a foreign key to them; deletes still cascade through the ORM.
+    ticket = models.OneToOneField(Ticket, on_delete=models.CASCADE, related_name='check_in', db_constraint=False)
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='check_ins')
+    scanned_at = models.DateTimeField()
+    scanned_by = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, related_name='+')
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Check-in of ticket {self.ticket_id} at {self.scanned_at}"
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='subscriptions')
@@ -137,11 +253,61 @@ class EventReview(models.Model):
 
     class Meta:
         unique_together = ('event', 'user')
+        indexes = [models.Index(fields=['rating'], name='core_eventreview_rating_idx')]
 
     def __str__(self):
         return f"Review by {self.user} on {self.event}: {self.rating}"
 
 
+class EventDailyStats(models.Model):
+    """
+    Ticket sales and reviews of one event on one day, kept up to date by
+    the refresh_rollups maintenance job. Club analytics read only this table.
+    """
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='daily_stats')
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    tickets_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    reviews = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['event', 'day'], name='core_eventdailystats_event_day')]
+        indexes = [models.Index(fields=['club', 'day'], name='core_eventdailystats_club_idx')]
+
+    def __str__(self):
+        return f"{self.event_id} on {self.day}: {self.tickets_sold} tickets"
+
+
+class RollupWatermark(models.Model):
+    """How far a rollup has read its source table, committed with the rollup rows."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
+
+
+class MaintenanceCheckpoint(models.Model):
+    """
+    Where a core.maintenance job stopped, saved with each batch it commits, and how
+    its last run went.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    # None between passes; otherwise whatever the job's batch function returned
+    cursor = models.JSONField(null=True, blank=True)
+    pass_started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_outcome = models.CharField(max_length=20, blank=True)
+    last_runtime = models.FloatField(null=True, blank=True)
+    last_processed = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_outcome or 'never run'}"
+
+
 class EmailVerification(models.Model):
     class Status(models.TextChoices):
         PENDING = 'Pending', 'Pending'
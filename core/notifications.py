@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils.module_loading import import_string
+from django_redis import get_redis_connection
+
+from core.models import Student, Subscription
+
+# notify:event:<id> marks an event as dispatched, notify:event:<id>:sent holds the
+# students already notified so a retried chunk does not email anyone twice.
+DEDUPE_TTL = 60 * 60 * 24 * 7
+
+
+def event_key(event_id):
+    return f'notify:event:{event_id}'
+
+
+def sent_key(event_id):
+    return f'notify:event:{event_id}:sent'
+
+
+def club_window_key(club_id):
+    return f'notify:club:{club_id}'
+
+
+class EmailTransport:
+    """Sends a chunk over a single SMTP connection."""
+
+    def send(self, event, recipients):
+        subject = f"New event from {event.club.name}: {event.title}"
+        body = (
+            f"{event.club.name} has posted a new event.\n\n"
+            f"{event.title}\n"
+            f"Starts: {event.start_date:%Y-%m-%d %H:%M} UTC\n\n"
+            f"{settings.DOMAIN_NAME}/api/events/{event.pk}/"
+        )
+        messages = [
+            EmailMultiAlternatives(subject, body, settings.EMAIL_HOST_USER, [student.email])
+            for student in recipients
+        ]
+        with get_connection() as connection:
+            return connection.send_messages(messages) or 0
+
+
+class LocalTransport:
+    """Keeps chunks in memory, for tests and local development."""
+
+    outbox = []
+
+    def send(self, event, recipients):
+        self.outbox.append((event.pk, [student.pk for student in recipients]))
+        return len(recipients)
+
+
+def get_transport():
+    return import_string(settings.NOTIFICATION_TRANSPORT)()
+
+
+def claim_event(event):
+    """
+    True if the event has not been announced yet and its club is still under
+    NOTIFICATION_CLUB_LIMIT announcements in the current window.
+    """
+    conn = get_redis_connection('default')
+    if not conn.set(event_key(event.pk), 1, nx=True, ex=DEDUPE_TTL):
+        return False
+
+    key = club_window_key(event.club_id)
+    with conn.pipeline() as pipe:
+        pipe.set(key, 0, nx=True, ex=settings.NOTIFICATION_CLUB_WINDOW)
+        pipe.incr(key)
+        _, announced = pipe.execute()
+    return announced <= settings.NOTIFICATION_CLUB_LIMIT
+
+
+def subscriber_chunks(club_id, size):
+    last_id = 0
+    subscriptions = Subscription.objects.filter(club_id=club_id).order_by('id')
+    while True:
+        chunk = list(subscriptions.filter(id__gt=last_id).values_list('id', 'user_id')[:size])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        yield [user_id for _, user_id in chunk]
+
+
+def unsent(event_id, user_ids):
+    conn = get_redis_connection('default')
+    with conn.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.sadd(sent_key(event_id), user_id)
+        pipe.expire(sent_key(event_id), DEDUPE_TTL)
+        added = pipe.execute()[:-1]
+    return [user_id for user_id, new in zip(user_ids, added) if new]
+
+
+def forget_sent(event_id, user_ids):
+    get_redis_connection('default').srem(sent_key(event_id), *user_ids)
+
+
+def notify_chunk(event, user_ids):
+    user_ids = unsent(event.pk, user_ids)
+    if not user_ids:
+        return 0
+    recipients = list(Student.objects.filter(pk__in=user_ids).exclude(email='').only('id', 'email'))
+    try:
+        return get_transport().send(event, recipients)
+    except Exception:
+        # Let the retry send them
+        forget_sent(event.pk, user_ids)
+        raise
@@ -0,0 +1,130 @@
+import re
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+# On PostgreSQL core_ticket is range-partitioned by the academic term of the ticket's
+# event (migration 0010): core_ticket_t<term> per term, and core_ticket_archive for
+# every term below its upper bound. Elsewhere it is a plain table and the DDL helpers
+# below do nothing.
+TICKET_TABLE = 'core_ticket'
+ARCHIVE_PARTITION = 'core_ticket_archive'
+TERM_PARTITION = re.compile(rf'^{TICKET_TABLE}_t(\d+)$')
+
+# Terms known to have a partition, or to fall in the archive
+_ensured = set()
+
+
+def academic_term(value):
+    """
+    Terms are numbered consecutively: calendar year * terms per year + index of the
+    term starting that year, so a term that began in an earlier year keeps its number.
+    """
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    months = settings.ACADEMIC_TERM_START_MONTHS
+    return value.year * len(months) + sum(value.month >= month for month in months) - 1
+
+
+def term_expression(field):
+    """academic_term() of a date or datetime field, in SQL."""
+    months = settings.ACADEMIC_TERM_START_MONTHS
+    started = [
+        Case(When(**{f'{field}__month__gte': month}, then=Value(1)), default=Value(0), output_field=IntegerField())
+        for month in months
+    ]
+    return ExtractYear(field) * len(months) + sum(started[1:], started[0]) - 1
+
+
+def term_start(term):
+    year, index = divmod(term, len(settings.ACADEMIC_TERM_START_MONTHS))
+    return date(year, settings.ACADEMIC_TERM_START_MONTHS[index], 1)
+
+
+def current_term():
+    return academic_term(timezone.now())
+
+
+def first_hot_term():
+    """Ticket lists read from this term on unless asked for older tickets."""
+    return current_term() - settings.TICKET_HOT_TERMS + 1
+
+
+def partition_name(term):
+    return f'{TICKET_TABLE}_t{term}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [TICKET_TABLE])
+        return cursor.fetchone()[0] == 'p'
+
+
+def archive_bound(cursor):
+    """First term that is not kept in the archive partition."""
+    cursor.execute("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = %s::regclass",
+                   [ARCHIVE_PARTITION])
+    # FOR VALUES FROM (MINVALUE) TO (4051)
+    return int(re.search(r'TO \((-?\d+)\)', cursor.fetchone()[0]).group(1))
+
+
+def term_partitions(cursor):
+    """{term: partition name} of the partitions attached to core_ticket, archive aside."""
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = %s::regclass", [TICKET_TABLE]
+    )
+    return {int(match.group(1)): match.group(0)
+            for match in (TERM_PARTITION.match(name) for name, in cursor.fetchall()) if match}
+
+
+def ensure_ticket_partitions(terms):
+    """Creates the partitions missing for `terms`. Returns how many were created."""
+    terms = set(terms) - _ensured
+    if not terms or not is_partitioned():
+        return 0
+
+    created = 0
+    with connection.cursor() as cursor:
+        bound = archive_bound(cursor)
+        existing = term_partitions(cursor)
+        for term in sorted(terms):
+            if term >= bound and term not in existing:
+                cursor.execute(f'CREATE TABLE IF NOT EXISTS {partition_name(term)} PARTITION OF {TICKET_TABLE} '
+                               f'FOR VALUES FROM ({term}) TO ({term + 1})')
+                created += 1
+    # Only remembered once the DDL has committed
+    transaction.on_commit(lambda: _ensured.update(terms))
+    return created
+
+
+def archive_ticket_terms(before):
+    """
+    Moves the tickets of every term below `before` into the archive partition and
+    drops their term partitions. Returns {term: tickets moved}. Reads and writes of
+    tickets wait until it commits.
+    """
+    if not is_partitioned():
+        return {}
+
+    moved = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        if before <= archive_bound(cursor):
+            return {}
+        old = {term: name for term, name in term_partitions(cursor).items() if term < before}
+
+        cursor.execute(f'ALTER TABLE {TICKET_TABLE} DETACH PARTITION {ARCHIVE_PARTITION}')
+        for term, name in sorted(old.items()):
+            cursor.execute(f'ALTER TABLE {TICKET_TABLE} DETACH PARTITION {name}')
+            cursor.execute(f'INSERT INTO {ARCHIVE_PARTITION} SELECT * FROM {name}')
+            moved[term] = cursor.rowcount
+            cursor.execute(f'DROP TABLE {name}')
+        cursor.execute(f'ALTER TABLE {TICKET_TABLE} ATTACH PARTITION {ARCHIVE_PARTITION} '
+                       f'FOR VALUES FROM (MINVALUE) TO ({before})')
+    return moved
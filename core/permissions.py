@@ -3,6 +3,38 @@ from rest_framework import permissions
 from core.models import ClubMember
 
 
+def head_club_ids(user):
+    # Users authenticated by ClaimsJWTAuthentication carry their head clubs in the token
+    club_ids = getattr(user, 'head_club_ids', None)
+    if club_ids is not None:
+        return club_ids
+    return set(ClubMember.objects.filter(
+        user_id=user.id,
+        role=ClubMember.RoleChoices.HEAD
+    ).values_list('club_id', flat=True))
+
+
+def request_head_club_ids(request):
+    """head_club_ids() of the request's user, loaded at most once per request."""
+    if not hasattr(request, '_head_club_ids'):
+        request._head_club_ids = head_club_ids(request.user)
+    return request._head_club_ids
+
+
+def is_club_head(user, club_id):
+    if club_id is None:
+        return False
+
+    club_ids = getattr(user, 'head_club_ids', None)
+    if club_ids is not None:
+        return int(club_id) in club_ids
+    return ClubMember.objects.filter(
+        user_id=user.id,
+        club_id=club_id,
+        role=ClubMember.RoleChoices.HEAD
+    ).exists()
+
+
 class IsAdminOrHeadOfThisClub(permissions.BasePermission):
 
     def has_permission(self, request, view):
@@ -11,11 +43,7 @@ class IsAdminOrHeadOfThisClub(permissions.BasePermission):
 
         club_pk = view.kwargs.get('club_pk')
         if club_pk:
-            return ClubMember.objects.filter(
-                user=request.user,
-                club_id=club_pk,
-                role=ClubMember.RoleChoices.HEAD
-            ).exists()
+            return is_club_head(request.user, club_pk)
 
         return False
 
@@ -24,10 +52,6 @@ class IsAdminOrHeadOfThisClub(permissions.BasePermission):
             return True
 
         if isinstance(obj, ClubMember):
-            return ClubMember.objects.filter(
-                user=request.user,
-                club=obj.club,
-                role=ClubMember.RoleChoices.HEAD
-            ).exists()
+            return is_club_head(request.user, obj.club_id)
 
-        return False
\ No newline at end of file
+        return False
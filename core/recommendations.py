@@ -0,0 +1,108 @@
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from scipy import sparse
+
+from core.models import Event, Ticket
+
+logger = logging.getLogger(__name__)
+
+# event id -> "id,id,..." of the events most often attended by the same students,
+# best first. Replaced as a whole by every run of build_recommendations().
+RECOMMENDATIONS_KEY = 'recommendations:events'
+
+
+def attendance():
+    """(student ids, event ids) of every ticket as two int64 arrays."""
+    rows = Ticket.objects.order_by().values_list('student_id', 'event_id').iterator(chunk_size=20000)
+    pairs = np.fromiter(rows, dtype=np.dtype((np.int64, 2)))
+    if not len(pairs):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def top_neighbours(similarity, k):
+    """For each row of a CSR matrix, the column indices of its k largest values, largest first."""
+    neighbours = []
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        columns, scores = similarity.indices[start:end], similarity.data[start:end]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            columns, scores = columns[best], scores[best]
+        neighbours.append(columns[np.lexsort((columns, -scores))])
+    return neighbours
+
+
+def co_attendance(students, events, candidates, k, min_shared):
+    """
+    Item-item cosine similarity of events over the students holding tickets to them.
+    Returns {event id: [similar candidate event ids]}.
+    """
+    student_ids, student_index = np.unique(students, return_inverse=True)
+    event_ids, event_index = np.unique(events, return_inverse=True)
+    attended = sparse.csr_matrix(
+        (np.ones(len(students), dtype=np.float32), (student_index, event_index)),
+        shape=(len(student_ids), len(event_ids))
+    )
+    # Tickets are unique per (student, event), but make repeated rows harmless
+    attended.data[:] = 1
+
+    shared = (attended.T @ attended).tocsr()
+    shared.setdiag(0)
+    shared.data[shared.data < min_shared] = 0
+    shared.eliminate_zeros()
+
+    sizes = np.asarray(attended.sum(axis=0)).ravel()
+    norm = sparse.diags(1 / np.sqrt(sizes))
+    # Only events that can still be attended are recommended
+    open_columns = sparse.diags(np.isin(event_ids, candidates).astype(np.float32))
+    similarity = (norm @ shared @ norm @ open_columns).tocsr()
+    similarity.eliminate_zeros()
+
+    return {
+        int(event_ids[row]): [int(event_ids[column]) for column in columns]
+        for row, columns in enumerate(top_neighbours(similarity, k))
+        if len(columns)
+    }
+
+
+def build_recommendations():
+    """Recomputes recommendations for every event with tickets. Returns how many events got some."""
+    students, events = attendance()
+    if not len(students):
+        get_redis_connection('default').delete(RECOMMENDATIONS_KEY)
+        return 0
+
+    candidates = np.fromiter(
+        Event.objects.filter(end_date__gte=timezone.now()).values_list('id', flat=True), dtype=np.int64
+    )
+    recommendations = co_attendance(students, events, candidates, settings.RECOMMENDATIONS_PER_EVENT,
+                                    settings.RECOMMENDATION_MIN_SHARED)
+
+    conn = get_redis_connection('default')
+    staging = f'{RECOMMENDATIONS_KEY}:rebuild'
+    with conn.pipeline() as pipe:
+        pipe.delete(staging)
+        items = [(event_id, ','.join(map(str, ids))) for event_id, ids in recommendations.items()]
+        for start in range(0, len(items), 1000):
+            pipe.hset(staging, mapping=dict(items[start:start + 1000]))
+        if recommendations:
+            pipe.rename(staging, RECOMMENDATIONS_KEY)
+        else:
+            pipe.delete(RECOMMENDATIONS_KEY)
+        pipe.execute()
+    return len(recommendations)
+
+
+def recommended_event_ids(event_id):
+    try:
+        value = get_redis_connection('default').hget(RECOMMENDATIONS_KEY, event_id)
+    except RedisError:
+        logger.warning("Recommendations unavailable", exc_info=True)
+        return []
+    return [int(pk) for pk in value.split(b',')] if value else []
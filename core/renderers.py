@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # orjson handles str/int/float/dict/list/datetime/UUID natively and their
+    # subclasses (ReturnDict, ErrorDetail); everything else behaves like DRF's encoder
+    if isinstance(obj, Decimal) and api_settings.COERCE_DECIMAL_TO_STRING:
+        return str(obj)
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = self.options
+        if accepted_media_type and 'indent=' in accepted_media_type:
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=options)
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
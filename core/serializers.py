@@ -1,9 +1,106 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.timezone import localdate
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from .models import *
+from .permissions import request_head_club_ids
+from .ticket_tokens import ticket_token
 from django.contrib.auth import get_user_model
 
 
-class StudentSerializer(serializers.ModelSerializer):
+def parse_field_list(value):
+    return {name.strip() for name in value.split(',') if name.strip()} if value else set()
+
+
+def sparse_fieldset_params(request):
+    if request is None or request.method not in SAFE_METHODS:
+        return set(), set()
+    params = getattr(request, 'query_params', request.GET)
+    return parse_field_list(params.get('fields')), parse_field_list(params.get('omit'))
+
+
+def context_fieldset_params(context):
+    """?fields and ?omit of the request in `context`, none when the view sets 'sparse_fields': False."""
+    if context.get('sparse_fields') is False:
+        return set(), set()
+    return sparse_fieldset_params(context.get('request'))
+
+
+def relation_path(model, lookup):
+    """Returns the forward relations `lookup` crosses, or None if it isn't a plain field lookup."""
+    parts = lookup.split('__')
+    relations = []
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if index == len(parts) - 1:
+            return relations if field.concrete and not field.many_to_many else None
+        if not (field.many_to_one or field.one_to_one):
+            return None
+        relations.append('__'.join(parts[:index + 1]))
+        model = field.related_model
+
+
+class SparseFieldsMixin:
+    """
+    Read requests can pick output fields with ?fields=a,b or drop them with ?omit=a,b.
+
+    Meta.field_lookups names the ORM lookups of fields that aren't plain model
+    attributes (method fields, properties) and Meta.field_annotations the queryset
+    method that computes a field, so prune_queryset() only loads what is returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, omit = context_fieldset_params(self.context)
+        if fields or omit:
+            for name in list(self.fields):
+                if (fields and name not in fields) or name in omit:
+                    self.fields.pop(name)
+
+    @classmethod
+    def prune_queryset(cls, queryset, context):
+        lookup_hints = getattr(cls.Meta, 'field_lookups', {})
+        annotation_hints = getattr(cls.Meta, 'field_annotations', {})
+        lookups, relations, annotations = set(), set(), set()
+        prunable = True
+
+        for name, field in cls(context=context).fields.items():
+            if field.write_only:
+                continue
+            if name in annotation_hints:
+                annotations.add(annotation_hints[name])
+            if name in lookup_hints:
+                paths = lookup_hints[name]
+            elif field.source != '*':
+                paths = ['__'.join(field.source_attrs)]
+            else:
+                prunable = False
+                continue
+            for path in paths:
+                crossed = relation_path(queryset.model, path)
+                if crossed is None:
+                    prunable = False
+                    continue
+                lookups.add(path)
+                relations.update(crossed)
+
+        fields, omit = context_fieldset_params(context)
+        if prunable and (fields or omit):
+            queryset = queryset.select_related(None).only(queryset.model._meta.pk.name, *lookups, *relations)
+        if relations:
+            queryset = queryset.select_related(*sorted(relations))
+        for method in sorted(annotations):
+            queryset = getattr(queryset, method)()
+        return queryset
+
+
+class StudentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
     password2 = serializers.CharField(write_only=True, required=True)
 
@@ -46,13 +143,20 @@ class StudentSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ClubSerializer(serializers.ModelSerializer):
+class ClubSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    member_count = serializers.ReadOnlyField()
+    subscriber_count = serializers.ReadOnlyField()
+    upcoming_event_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Club
-        fields = ['id', 'name', 'description', 'image', 'created_at']
+        fields = ['id', 'name', 'description', 'image', 'created_at',
+                  'member_count', 'subscriber_count', 'upcoming_event_count']
         read_only_fields = ['created_at']
+        field_lookups = {'image': ['image'], 'member_count': [], 'subscriber_count': [], 'upcoming_event_count': []}
+        field_annotations = {'member_count': 'with_counts', 'subscriber_count': 'with_counts',
+                             'upcoming_event_count': 'with_counts'}
 
     def validate_name(self, value):
         if Club.objects.filter(name__iexact=value).exists():
@@ -66,7 +170,7 @@ class ClubSerializer(serializers.ModelSerializer):
 
 
 
-class ClubMemberSerializer(serializers.ModelSerializer):
+class ClubMemberSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     club_name = serializers.ReadOnlyField(source='club.name')
     class Meta:
@@ -89,12 +193,13 @@ class ClubMemberSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Only admin users can assign the HEAD role.")
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
 
     class Meta:
         model = Room
         fields = ['id', 'name', 'capacity', 'location_description', 'image']
+        field_lookups = {'image': ['image']}
 
     def get_image(self, obj):
         if obj.image:
@@ -102,7 +207,7 @@ class RoomSerializer(serializers.ModelSerializer):
         return None
 
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
     club_name = serializers.ReadOnlyField(source='club.name')
     room_name = serializers.ReadOnlyField(source='room.name')
@@ -118,6 +223,8 @@ class EventSerializer(serializers.ModelSerializer):
             'ticket_type', 'tickets_available', 'tickets_sold'
         ]
         read_only_fields = ['created_at', 'tickets_available', 'tickets_sold']
+        field_lookups = {'image': ['image'], 'tickets_sold': [], 'tickets_available': ['total_tickets']}
+        field_annotations = {'tickets_sold': 'with_ticket_counts', 'tickets_available': 'with_ticket_counts'}
 
     def validate(self, data):
         if data.get('start_date') and data.get('end_date'):
@@ -139,14 +246,26 @@ class EventSerializer(serializers.ModelSerializer):
         return None
 
 
-class TicketSerializer(serializers.ModelSerializer):
+class TicketSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     student_username = serializers.ReadOnlyField(source='student.username')
     event_title = serializers.ReadOnlyField(source='event.title')
+    token = serializers.SerializerMethodField()
 
     class Meta:
         model = Ticket
-        fields = ['id', 'student', 'student_username', 'event', 'event_title', 'purchased_at']
+        fields = ['id', 'student', 'student_username', 'event', 'event_title', 'purchased_at', 'token']
         read_only_fields = ['purchased_at']
+        field_lookups = {'token': ['student', 'event__end_date', 'event__club']}
+
+    def get_token(self, obj):
+        # The token gets its holder in at the door, so only they, staff and the club head see it
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        if obj.student_id == user.id or user.is_staff or obj.event.club_id in request_head_club_ids(request):
+            return ticket_token(obj)
+        return None
 
     def validate(self, data):
         event = data.get('event')
@@ -156,7 +275,7 @@ class TicketSerializer(serializers.ModelSerializer):
             )
 
         student = data.get('student')
-        if student and event and Ticket.objects.filter(student=student, event=event).exists():
+        if student and event and Ticket.objects.for_event(event).filter(student=student).exists():
             raise serializers.ValidationError(
                 {"student": "This student already has a ticket for this event."}
             )
@@ -170,7 +289,33 @@ class TicketSerializer(serializers.ModelSerializer):
         return data
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class CheckInScanSerializer(serializers.Serializer):
+    token = serializers.CharField(max_length=100)
+    # When the scanner read the code, which may be well before the batch is synced
+    scanned_at = serializers.DateTimeField(required=False)
+
+
+class CheckInBatchSerializer(serializers.Serializer):
+    scans = CheckInScanSerializer(many=True, allow_empty=False, max_length=settings.CHECK_IN_MAX_SCANS)
+
+
+class AnalyticsRangeSerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        end = data.get('end') or localdate()
+        start = data.get('start') or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError({"start": "Start must not be after end."})
+        if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+            raise serializers.ValidationError(
+                {"start": f"Ranges are limited to {settings.ANALYTICS_MAX_DAYS} days."}
+            )
+        return {'start': start, 'end': end}
+
+
+class SubscriptionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
     club_name = serializers.ReadOnlyField(source='club.name')
 
@@ -191,7 +336,19 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return data
 
 
-class EventReviewSerializer(serializers.ModelSerializer):
+class BulkUsersSerializer(serializers.Serializer):
+    users = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_USERS
+    )
+
+    def validate_users(self, value):
+        # Repeated ids are reported once
+        return list(dict.fromkeys(value))
+
+
+class EventReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_username = serializers.ReadOnlyField(source='user.username')
     event_title = serializers.ReadOnlyField(source='event.title')
 
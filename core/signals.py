@@ -1,16 +1,199 @@
-from django.db.models.signals import post_save, post_delete
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django_redis import get_redis_connection
-from .models import Event  # Ensure this imports your Event model correctly
+from . import feed
+from .cache import invalidate_cached
+from . import trending
+from .analytics import subtract_ticket
+from .authentication import bump_role_version
+from .partitions import academic_term, ensure_ticket_partitions
+from .models import Club, ClubMember, Event, EventReview, Student, Subscription, Ticket
+from .tasks import fan_out_event, notify_subscribers
+
+# Page keys look like ":1:views.single_flight.event_list.<hash>", so the key prefix
+# has to be matched anywhere in the key.
+EVENT_LIST_PATTERN = "*.event_list.*"
+CLUB_LIST_PATTERN = "*.club_list.*"
+
+
+# Off inside bulk_deletes(), whose caller does the work of the per-row delete
+# receivers once for all rows
+_per_row_deletes = ContextVar('per_row_deletes', default=True)
+
+
+@contextmanager
+def bulk_deletes():
+    token = _per_row_deletes.set(False)
+    try:
+        yield
+    finally:
+        _per_row_deletes.reset(token)
+
+
+def invalidate_after_commit(*prefixes):
+    # Bumped before commit, a concurrent request could rebuild a page from the old
+    # rows and store it under the new generation
+    def invalidate():
+        for prefix in prefixes:
+            invalidate_cached(prefix)
+
+    transaction.on_commit(invalidate)
+
 
 @receiver(post_save, sender=Event)
 def invalidate_cache_on_save(sender, instance, **kwargs):
     print(f"Event saved (ID: {instance.id}), invalidating cache...")
-    conn = get_redis_connection("default")
-    conn.delete_pattern("event_list:*")  # Changed from product_list to event_list
+    invalidate_after_commit('event_list', 'club_list')
+
 
 @receiver(post_delete, sender=Event)
 def invalidate_cache_on_delete(sender, instance, **kwargs):
     print(f"Event deleted (ID: {instance.id}), invalidating cache...")
-    conn = get_redis_connection("default")
-    conn.delete_pattern("event_list:*")  # Changed from product_list to event_list
\ No newline at end of file
+    invalidate_after_commit('event_list', 'club_list')
+
+
+# The club list carries member, subscriber and upcoming event counts
+@receiver(post_save, sender=Club)
+@receiver(post_delete, sender=Club)
+@receiver(post_save, sender=ClubMember)
+@receiver(post_delete, sender=ClubMember)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_club_list(sender, instance, **kwargs):
+    if _per_row_deletes.get():
+        invalidate_after_commit('club_list')
+
+
+@receiver(post_save, sender=Event)
+def push_event_to_feeds(sender, instance, **kwargs):
+    # Re-run on updates too so a moved start date reorders subscriber feeds
+    transaction.on_commit(lambda: fan_out_event.delay(instance.id))
+
+
+@receiver(post_save, sender=Event)
+def announce_event(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: notify_subscribers.delay(instance.id))
+
+
+@receiver(post_delete, sender=Event)
+def drop_event_from_feeds(sender, instance, **kwargs):
+    feed.remove_event_from_feeds(instance.id, instance.club_id)
+
+
+# Tickets carry the academic term of their event, which core_ticket is partitioned by
+@receiver(post_init, sender=Event)
+def remember_start_date(sender, instance, **kwargs):
+    instance._start_date = instance.__dict__.get('start_date')
+
+
+@receiver(post_save, sender=Event)
+def keep_tickets_in_term(sender, instance, created, **kwargs):
+    if 'start_date' not in instance.__dict__:
+        return
+    term = academic_term(instance.start_date)
+    ensure_ticket_partitions([term])
+    previous = academic_term(instance._start_date) if instance._start_date is not None else term
+    if not created and previous != term:
+        # PostgreSQL moves the rows into the new term's partition
+        Ticket.objects.filter(event_id=instance.pk, term=previous).update(term=term)
+    instance._start_date = instance.start_date
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill_subscription(instance.user_id, instance.club_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def prune_feed(sender, instance, **kwargs):
+    if _per_row_deletes.get():
+        feed.remove_subscription(instance.user_id, instance.club_id)
+
+
+# Access tokens carry is_staff and head clubs; a change to either invalidates them
+ROLE_FIELDS = ('is_staff', 'is_superuser', 'is_active')
+
+
+def role_state(instance):
+    return tuple(instance.__dict__.get(field) for field in ROLE_FIELDS)
+
+
+@receiver(post_init, sender=Student)
+def remember_roles(sender, instance, **kwargs):
+    instance._role_state = role_state(instance)
+
+
+@receiver(pre_save, sender=Student)
+def keep_role_version(sender, instance, raw, update_fields, **kwargs):
+    # role_version is only ever bumped with update(), so a copy loaded before a bump
+    # re-reads it rather than writing the old version back
+    if raw or instance._state.adding or 'role_version' not in instance.__dict__:
+        return
+    if update_fields is not None and 'role_version' not in update_fields:
+        return
+    current = sender.objects.filter(pk=instance.pk).values_list('role_version', flat=True).first()
+    if current is not None:
+        instance.role_version = current
+
+
+@receiver(post_save, sender=Student)
+def invalidate_tokens_on_role_change(sender, instance, created, **kwargs):
+    if not created and role_state(instance) != instance._role_state:
+        bump_role_version(instance.pk)
+    instance._role_state = role_state(instance)
+
+
+@receiver(post_delete, sender=Student)
+def invalidate_tokens_on_delete(sender, instance, **kwargs):
+    bump_role_version(instance.pk)
+
+
+# Tokens list head clubs only, so plain memberships never invalidate them
+def head_club(instance):
+    if instance.__dict__.get('role') == ClubMember.RoleChoices.HEAD:
+        return instance.__dict__.get('club_id')
+    return None
+
+
+@receiver(post_init, sender=ClubMember)
+def remember_head_club(sender, instance, **kwargs):
+    instance._head_club = head_club(instance)
+
+
+@receiver(post_save, sender=ClubMember)
+def invalidate_tokens_on_head_change(sender, instance, created, **kwargs):
+    previous = None if created else instance._head_club
+    if head_club(instance) != previous:
+        bump_role_version(instance.user_id)
+    instance._head_club = head_club(instance)
+
+
+@receiver(post_delete, sender=ClubMember)
+def invalidate_tokens_on_head_removal(sender, instance, **kwargs):
+    if _per_row_deletes.get() and instance.role == ClubMember.RoleChoices.HEAD:
+        bump_role_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Ticket)
+def subtract_deleted_ticket(sender, instance, origin=None, **kwargs):
+    # Rollups count the tickets that exist, as reconcile_rollups recounts them; the
+    # rollup rows of a deleted event go with it
+    if not (isinstance(origin, Event) or getattr(origin, 'model', None) is Event):
+        subtract_ticket(instance)
+
+
+@receiver(post_save, sender=Ticket)
+def rank_ticket_sale(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: trending.record_ticket(instance.event_id))
+
+
+@receiver(post_save, sender=EventReview)
+def rank_review(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: trending.record_review(instance.event_id))
@@ -25,7 +25,7 @@ from celery import shared_task
 
 logger = logging.getLogger(__name__)
 
-@shared_task
+@shared_task(ignore_result=True)
 def send_verification_email(username, code):
     from django.contrib.auth import get_user_model
     User = get_user_model()
@@ -79,3 +79,61 @@ def send_verification_email(username, code):
         return False
 
 # celery -A store worker --loglevel=info --pool=solo
+
+
+# Feed writes are idempotent, so a task lost with its worker is simply run again
+@shared_task(ignore_result=True, acks_late=True)
+def fan_out_event(event_id):
+    from core.feed import add_event_to_feeds
+
+    return add_event_to_feeds(event_id)
+
+
+@shared_task(ignore_result=True)
+def notify_subscribers(event_id):
+    from core.models import Event
+    from core.notifications import claim_event, subscriber_chunks
+
+    event = Event.objects.filter(pk=event_id).only('id', 'club_id').first()
+    if event is None or not claim_event(event):
+        return 0
+
+    chunks = 0
+    for user_ids in subscriber_chunks(event.club_id, settings.NOTIFICATION_CHUNK_SIZE):
+        send_event_notifications.delay(event_id, user_ids)
+        chunks += 1
+    return chunks
+
+
+@shared_task(ignore_result=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
+def send_event_notifications(event_id, user_ids):
+    from core.models import Event
+    from core.notifications import notify_chunk
+
+    event = Event.objects.select_related('club').filter(pk=event_id).first()
+    if event is None:
+        return 0
+    return notify_chunk(event, user_ids)
+
+
+# Jobs hold a lease and commit a checkpoint with every batch, so a redelivered or
+# overlapping run either skips or resumes where the last one stopped
+@shared_task(ignore_result=True, acks_late=True)
+def run_maintenance(name):
+    from core.maintenance import run_job
+
+    return run_job(name)
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def rebuild_trending():
+    from core.trending import rebuild_trending
+
+    return rebuild_trending()
+
+
+@shared_task(ignore_result=True, acks_late=True)
+def build_recommendations():
+    from core.recommendations import build_recommendations
+
+    return build_recommendations()
@@ -0,0 +1,109 @@
+import logging
+import time
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from rest_framework.throttling import AnonRateThrottle, SimpleRateThrottle, UserRateThrottle
+
+logger = logging.getLogger(__name__)
+
+# A bucket holds up to `capacity` tokens and refills continuously at `rate` tokens per
+# second. The state is two numbers, whatever the limit, and is read and written in one call.
+TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+_token_bucket = None
+
+
+def take_token(key, capacity, duration):
+    global _token_bucket
+    conn = get_redis_connection('default')
+    if _token_bucket is None:
+        _token_bucket = conn.register_script(TOKEN_BUCKET)
+    allowed, tokens = _token_bucket(keys=[key], args=[capacity, capacity / duration, time.time()], client=conn)
+    return bool(allowed), float(tokens)
+
+
+class RedisRateThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle with a token bucket in Redis instead of a request history in
+    the cache. Requests are let through if Redis cannot be reached.
+    """
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        try:
+            allowed, tokens = take_token(self.key, self.num_requests, self.duration)
+        except RedisError:
+            logger.warning("Throttle store unavailable, letting request through", exc_info=True)
+            return True
+
+        self.retry_after = None if allowed else (1 - tokens) * self.duration / self.num_requests
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class RedisAnonRateThrottle(RedisRateThrottle, AnonRateThrottle):
+    pass
+
+
+class RedisUserRateThrottle(RedisRateThrottle, UserRateThrottle):
+    pass
+
+
+class ScopedRedisRateThrottle(RedisRateThrottle):
+    """
+    Applies the rate named by the view's `throttle_scope`, which is either a scope for
+    every method or a dict of scopes by method, e.g. {'POST': 'ticket_purchase'}.
+    Views without a scope for the request method are not throttled.
+    """
+
+    scope_attr = 'throttle_scope'
+
+    def __init__(self):
+        # The rate depends on the view, so it is resolved in allow_request
+        pass
+
+    def allow_request(self, request, view):
+        scope = getattr(view, self.scope_attr, None)
+        if isinstance(scope, dict):
+            scope = scope.get('GET' if request.method == 'HEAD' else request.method)
+        if not scope:
+            return True
+
+        self.scope = scope
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
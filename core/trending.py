@@ -0,0 +1,129 @@
+import heapq
+import logging
+import time
+from datetime import timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from core.models import Event, EventReview, Ticket
+
+logger = logging.getLogger(__name__)
+
+# Scores decay by half every TRENDING_HALF_LIFE seconds. Instead of lowering every score
+# over time, new activity is added with a weight that doubles every half-life counted
+# from TRENDING_EPOCH_KEY, which keeps the ranking equivalent and the set one ZREVRANGE
+# away. rebuild_trending() moves the epoch forward before the weights get large.
+TRENDING_KEY = 'trending:events'
+# Detail views are not stored in the database, so they are kept apart to survive rebuilds
+TRENDING_VIEWS_KEY = 'trending:events:views'
+TRENDING_EPOCH_KEY = 'trending:epoch'
+
+TICKET_WEIGHT = 1.0
+REVIEW_WEIGHT = 2.0
+VIEW_WEIGHT = 0.1
+
+RECORD = """
+local epoch = tonumber(redis.call('GET', KEYS[3]))
+if not epoch then
+    epoch = tonumber(ARGV[1])
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+local increment = tonumber(ARGV[3]) * 2 ^ ((tonumber(ARGV[1]) - epoch) / tonumber(ARGV[4]))
+redis.call('ZINCRBY', KEYS[1], increment, ARGV[2])
+if ARGV[5] == '1' then
+    redis.call('ZINCRBY', KEYS[2], increment, ARGV[2])
+end
+return tostring(increment)
+"""
+
+_record = None
+
+
+def connection():
+    return get_redis_connection('default')
+
+
+def record(event_id, weight, view=False):
+    global _record
+    try:
+        conn = connection()
+        if _record is None:
+            _record = conn.register_script(RECORD)
+        _record(keys=[TRENDING_KEY, TRENDING_VIEWS_KEY, TRENDING_EPOCH_KEY],
+                args=[time.time(), event_id, weight, settings.TRENDING_HALF_LIFE, int(view)], client=conn)
+    except RedisError:
+        logger.warning("Could not update trending score of event %s", event_id, exc_info=True)
+
+
+def record_ticket(event_id):
+    record(event_id, TICKET_WEIGHT)
+
+
+def record_review(event_id):
+    record(event_id, REVIEW_WEIGHT)
+
+
+def record_view(event_id):
+    record(event_id, VIEW_WEIGHT, view=True)
+
+
+def trending_event_ids(limit):
+    return [int(member) for member in connection().zrevrange(TRENDING_KEY, 0, limit - 1)]
+
+
+def _decayed(rows, weight, epoch):
+    scores = {}
+    for row in rows:
+        age = row['hour'].timestamp() - epoch
+        scores[row['event_id']] = scores.get(row['event_id'], 0) + \
+            row['count'] * weight * 2 ** (age / settings.TRENDING_HALF_LIFE)
+    return scores
+
+
+def rebuild_trending():
+    """
+    Recomputes ticket and review scores of current events from the database and moves
+    the epoch to now. Returns the number of ranked events.
+    """
+    now = timezone.now()
+    epoch = now.timestamp()
+    since = now - timedelta(seconds=settings.TRENDING_WINDOW)
+    events = set(Event.objects.filter(end_date__gte=now).values_list('id', flat=True))
+
+    # Activity is bucketed by hour, which bounds the rows read by events x window hours
+    scores = {}
+    for model, field, weight in ((Ticket, 'purchased_at', TICKET_WEIGHT), (EventReview, 'created_at', REVIEW_WEIGHT)):
+        rows = model.objects.filter(event__end_date__gte=now, **{f'{field}__gte': since}).annotate(
+            hour=TruncHour(field)
+        ).values('event_id', 'hour').annotate(count=Count('id')).order_by()
+        for event_id, score in _decayed(rows, weight, epoch).items():
+            scores[event_id] = scores.get(event_id, 0) + score
+
+    conn = connection()
+    previous = conn.get(TRENDING_EPOCH_KEY)
+    factor = 2 ** ((float(previous) - epoch) / settings.TRENDING_HALF_LIFE) if previous else 0
+    # Detail views are carried over, rescaled to the new epoch
+    views = {int(member): score * factor
+             for member, score in conn.zrange(TRENDING_VIEWS_KEY, 0, -1, withscores=True)
+             if int(member) in events and score * factor > 0}
+    for event_id, score in views.items():
+        scores[event_id] = scores.get(event_id, 0) + score
+    top = dict(heapq.nlargest(settings.TRENDING_MAX_EVENTS, scores.items(), key=itemgetter(1)))
+
+    # Activity recorded while this ran is lost, which a ranking can afford
+    with conn.pipeline() as pipe:
+        pipe.delete(TRENDING_KEY, TRENDING_VIEWS_KEY)
+        if top:
+            pipe.zadd(TRENDING_KEY, top)
+        views = {event_id: score for event_id, score in views.items() if event_id in top}
+        if views:
+            pipe.zadd(TRENDING_VIEWS_KEY, views)
+        pipe.set(TRENDING_EPOCH_KEY, epoch)
+        pipe.execute()
+    return len(top)
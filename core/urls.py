@@ -2,9 +2,12 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path('home/', views.HomeView.as_view(), name='home'),
+
     path('students/', views.StudentListCreateView.as_view(), name='student-list'),
     path('students/<int:pk>/', views.StudentDetailAPIView.as_view(), name='student-detail'),
     path('students/current/', views.CurrentStudentView.as_view(), name='current-student'),
+    path('students/current/feed/', views.CurrentStudentFeedView.as_view(), name='current-student-feed'),
     path('students/<int:student_pk>/tickets/', views.StudentTicketsView.as_view(), name='student-tickets'),
     path('students/<int:user_pk>/clubs/', views.UserClubMembershipsView.as_view(), name='user-clubs'),
     path('students/<int:user_pk>/subscriptions/', views.SubscriptionListCreateView.as_view(),
@@ -13,8 +16,12 @@ urlpatterns = [
     path('clubs/', views.ClubListCreateView.as_view(), name='club-list'),
     path('clubs/<int:pk>/', views.ClubDetailAPIView.as_view(), name='club-detail'),
     path('clubs/<int:club_pk>/members/', views.ClubMemberListCreateView.as_view(), name='club-members'),
+    path('clubs/<int:club_pk>/members/bulk/', views.ClubMemberBulkView.as_view(), name='club-members-bulk'),
     path('clubs/<int:club_pk>/events/', views.EventListCreateView.as_view(), name='club-events'),
     path('clubs/<int:club_pk>/subscriptions/', views.SubscriptionListCreateView.as_view(), name='club-subscriptions'),
+    path('clubs/<int:club_pk>/subscriptions/bulk/', views.SubscriptionBulkView.as_view(),
+         name='club-subscriptions-bulk'),
+    path('clubs/<int:club_pk>/analytics/', views.ClubAnalyticsView.as_view(), name='club-analytics'),
     path('clubs/<int:club_pk>/head/<int:user_pk>/', views.ClubHeadAssignView.as_view(), name='club-head-assign'),
 
     path('memberships/<int:pk>/', views.ClubMemberDetailView.as_view(), name='membership-detail'),
@@ -23,8 +30,10 @@ urlpatterns = [
     path('rooms/<int:pk>/', views.RoomDetailView.as_view(), name='room-detail'),
 
     path('events/', views.EventListCreateView.as_view(), name='event-list'),
+    path('events/trending/', views.EventTrendingView.as_view(), name='event-trending'),
     path('events/<int:pk>/', views.EventDetailView.as_view(), name='event-detail'),
     path('events/<int:event_pk>/tickets/', views.TicketListCreateView.as_view(), name='event-tickets'),
+    path('events/<int:event_pk>/check-ins/', views.EventCheckInView.as_view(), name='event-check-ins'),
     path('events/<int:event_pk>/reviews/', views.EventReviewListCreateView.as_view(), name='event-reviews'),
 
     path('tickets/', views.TicketListCreateView.as_view(), name='ticket-list'),
@@ -1,34 +1,136 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
 from django.shortcuts import redirect
 from rest_framework import generics, permissions, views
 from rest_framework.response import Response
 from .serializers import *
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from .permissions import *
 from rest_framework.views import APIView
 from rest_framework import status
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from .analytics import club_analytics
+from .authentication import bump_role_versions
+from .feed import backfill_subscriptions, read_feed, remove_subscriptions
+from .idempotency import IdempotencyMixin
+from .signals import bulk_deletes
+from .recommendations import recommended_event_ids
+from .trending import record_view, trending_event_ids
+from .ticket_tokens import ExpiredTicketToken, InvalidTicketToken, verify_ticket_token
+from .cache import cached_value, invalidate_cached, single_flight_cache_page
+
+from .throttling import RedisAnonRateThrottle, RedisUserRateThrottle
+
+
+class SparseFieldsViewMixin:
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = self.get_serializer_class().prune_queryset(queryset, self.get_serializer_context())
+        return queryset
+
+
+# Shared by the per-student list endpoints and HomeView
+def student_tickets(student_pk):
+    return Ticket.objects.filter(student_id=student_pk).select_related('event', 'student', 'event__club')
+
+
+def user_subscriptions(user_pk):
+    return Subscription.objects.filter(user_id=user_pk).select_related('user', 'club')
+
+
+def user_memberships(user_pk):
+    return ClubMember.objects.filter(user_id=user_pk).select_related('user', 'club')
 
 
 class CurrentStudentView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        serializer = StudentSerializer(request.user)
+        serializer = StudentSerializer(request.user, context={'request': request})
         return Response(serializer.data)
 
 
-class StudentListCreateView(generics.ListCreateAPIView):
+class CurrentStudentFeedView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    page_size = 20
+    max_page_size = 100
+    read_from_replica = True
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.page_size)), self.max_page_size)
+        except ValueError:
+            limit = self.page_size
+        event_ids, cursor = read_feed(request.user.id, request.query_params.get('cursor'), max(limit, 1))
+
+        context = {'request': request}
+        queryset = Event.objects.filter(id__in=event_ids).select_related('club', 'room')
+        events = {event.id: event for event in EventSerializer.prune_queryset(queryset, context)}
+        # Events deleted since they were pushed are skipped
+        serializer = EventSerializer([events[pk] for pk in event_ids if pk in events], many=True, context=context)
+
+        next_url = None
+        if cursor:
+            next_url = request.build_absolute_uri(
+                request.path + '?' + urlencode({**request.query_params.dict(), 'cursor': cursor})
+            )
+        return Response({'next': next_url, 'results': serializer.data})
+
+
+class HomeView(views.APIView):
+    """
+    The app's home screen in one response: the current student, the next
+    HOME_UPCOMING_EVENTS upcoming events, and the student's current tickets,
+    subscriptions and club memberships. Each section is one query on the queryset
+    of its own endpoint; upcoming events are the same for everyone and cached with
+    the event list. ?fields and ?omit are not applied to sections.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
+
+    def get(self, request):
+        user_pk = request.user.id
+        context = {'request': request, 'sparse_fields': False}
+        return Response({
+            'student': StudentSerializer(request.user, context=context).data,
+            'upcoming_events': self.upcoming_events(context),
+            'tickets': self.section(TicketSerializer, student_tickets(user_pk).hot(), context),
+            'subscriptions': self.section(SubscriptionSerializer, user_subscriptions(user_pk), context),
+            'clubs': self.section(ClubMemberSerializer, user_memberships(user_pk), context),
+        })
+
+    def section(self, serializer_class, queryset, context, limit=None):
+        queryset = serializer_class.prune_queryset(queryset, context)
+        return serializer_class(queryset[:limit], many=True, context=context).data
+
+    def upcoming_events(self, context):
+        def compute():
+            queryset = Event.objects.filter(start_date__gte=timezone.now()).select_related('club', 'room')
+            # Twice the section, so events that start while the copy is cached can be dropped
+            return self.section(EventSerializer, queryset.order_by('start_date'), context,
+                                settings.HOME_UPCOMING_EVENTS * 2)
+
+        # Keyed on the host like the event list pages, as serializers may build absolute URLs
+        name = f'home.upcoming_events.{context["request"].get_host()}'
+        events = cached_value('event_list', name, 60 * 15, compute)
+        now = timezone.now()
+        return [event for event in events if parse_datetime(event['start_date']) >= now][:settings.HOME_UPCOMING_EVENTS]
+
+
+class StudentListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     queryset = Student.objects.all()
     serializer_class = StudentSerializer
     permission_classes = [permissions.AllowAny]
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [RedisAnonRateThrottle, RedisUserRateThrottle]
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -43,11 +145,11 @@ class StudentListCreateView(generics.ListCreateAPIView):
         verification.send_verification_email()
 
 
-class StudentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class StudentDetailAPIView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Student.objects.all()
     serializer_class = StudentSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [RedisAnonRateThrottle, RedisUserRateThrottle]
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -59,9 +161,12 @@ class StudentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
         serializer.save()
 
 
-class ClubListCreateView(generics.ListCreateAPIView):
-    queryset = Club.objects.all().prefetch_related('members', 'events')
+@method_decorator(single_flight_cache_page(60 * 15, key_prefix='club_list'), name='list')
+class ClubListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
+    queryset = Club.objects.all()
     serializer_class = ClubSerializer
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -74,9 +179,11 @@ class ClubListCreateView(generics.ListCreateAPIView):
         serializer.save()
 
 
-class ClubDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Club.objects.all().prefetch_related('members', 'events')
+class ClubDetailAPIView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Club.objects.all()
     serializer_class = ClubSerializer
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -94,9 +201,10 @@ class ClubDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
-class ClubMemberListCreateView(generics.ListCreateAPIView):
+class ClubMemberListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = ClubMemberSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
 
     def get_queryset(self):
         club_pk = self.kwargs.get('club_pk')
@@ -113,7 +221,7 @@ class ClubMemberListCreateView(generics.ListCreateAPIView):
             serializer.save()
 
 
-class ClubMemberDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ClubMemberDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ClubMemberSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrHeadOfThisClub]
     queryset = ClubMember.objects.all()
@@ -126,24 +234,110 @@ class ClubMemberDetailView(generics.RetrieveUpdateDestroyAPIView):
         serializer.save()
 
 
-class UserClubMembershipsView(generics.ListAPIView):
+class ClubUsersBulkView(APIView):
+    """
+    Adds or removes many students from a club in a fixed number of queries. POST and
+    DELETE take {"users": [ids]} and answer with a result for every id.
+    """
+    model = None
+
+    def user_ids(self, request):
+        serializer = BulkUsersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['users']
+
+    # Both hooks run inside the request's transaction; Redis work waits for the commit
+    def after_create(self, club_pk, user_ids):
+        transaction.on_commit(lambda: invalidate_cached('club_list'))
+
+    def after_delete(self, club_pk, user_ids):
+        transaction.on_commit(lambda: invalidate_cached('club_list'))
+
+    def post(self, request, club_pk):
+        user_ids = self.user_ids(request)
+        if not Club.objects.filter(pk=club_pk).exists():
+            raise NotFound("Club not found.")
+
+        with transaction.atomic():
+            students = set(Student.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+            existing = set(self.model.objects.filter(
+                club_id=club_pk,
+                user_id__in=user_ids
+            ).values_list('user_id', flat=True))
+            new = [pk for pk in user_ids if pk in students and pk not in existing]
+
+            # A row added by a concurrent request since the check above is skipped, not an error
+            self.model.objects.bulk_create([self.model(club_id=club_pk, user_id=pk) for pk in new],
+                                           ignore_conflicts=True)
+            if new:
+                self.after_create(club_pk, new)
+
+        results = []
+        for pk in user_ids:
+            if pk not in students:
+                results.append({'user': pk, 'status': 'not_found'})
+            elif pk in existing:
+                results.append({'user': pk, 'status': 'exists'})
+            else:
+                results.append({'user': pk, 'status': 'created'})
+        return Response(
+            {'created': len(new), 'results': results},
+            status=status.HTTP_201_CREATED if new else status.HTTP_200_OK
+        )
+
+    def delete(self, request, club_pk):
+        user_ids = self.user_ids(request)
+        with transaction.atomic():
+            queryset = self.model.objects.filter(club_id=club_pk, user_id__in=user_ids)
+            removed = set(queryset.values_list('user_id', flat=True))
+            # after_delete() does the work of the per-row delete receivers once for all rows
+            with bulk_deletes():
+                queryset.delete()
+            if removed:
+                self.after_delete(club_pk, sorted(removed))
+
+        results = [{'user': pk, 'status': 'deleted' if pk in removed else 'not_found'} for pk in user_ids]
+        return Response({'deleted': len(removed), 'results': results})
+
+
+class ClubMemberBulkView(ClubUsersBulkView):
+    model = ClubMember
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrHeadOfThisClub]
+
+    def after_delete(self, club_pk, user_ids):
+        super().after_delete(club_pk, user_ids)
+        # Tokens only list head clubs
+        heads = [pk for pk in user_ids if pk in self.heads]
+        if heads:
+            bump_role_versions(heads)
+
+    def delete(self, request, club_pk):
+        user_ids = self.user_ids(request)
+        self.heads = set(ClubMember.objects.filter(
+            club_id=club_pk,
+            user_id__in=user_ids,
+            role=ClubMember.RoleChoices.HEAD
+        ).values_list('user_id', flat=True))
+        if self.heads and not request.user.is_staff:
+            raise PermissionDenied("Only admin users can remove club heads.")
+        return super().delete(request, club_pk)
+
+
+class UserClubMembershipsView(SparseFieldsViewMixin, generics.ListAPIView):
     serializer_class = ClubMemberSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
 
     def get_queryset(self):
         user_pk = self.kwargs.get('user_pk')
 
         if int(user_pk) == self.request.user.id:
-            return ClubMember.objects.filter(user_id=user_pk).select_related('user', 'club')
+            return user_memberships(user_pk)
 
         if self.request.user.is_staff:
-            return ClubMember.objects.filter(user_id=user_pk).select_related('user', 'club')
+            return user_memberships(user_pk)
 
-        # Cache this query result to avoid multiple DB hits
-        head_clubs = list(ClubMember.objects.filter(
-            user=self.request.user,
-            role=ClubMember.RoleChoices.HEAD
-        ).values_list('club_id', flat=True))
+        head_clubs = head_club_ids(self.request.user)
 
         return ClubMember.objects.filter(
             user_id=user_pk,
@@ -151,6 +345,17 @@ class UserClubMembershipsView(generics.ListAPIView):
         ).select_related('user', 'club')
 
 
+class ClubAnalyticsView(APIView):
+    """Ticket sales, revenue and reviews of a club per day and per event, from the rollups."""
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrHeadOfThisClub]
+    read_from_replica = True
+
+    def get(self, request, club_pk):
+        serializer = AnalyticsRangeSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(club_analytics(club_pk, **serializer.validated_data))
+
+
 class ClubHeadAssignView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
@@ -190,9 +395,11 @@ class ClubHeadAssignView(APIView):
             )
 
 
-class RoomListCreateView(generics.ListCreateAPIView):
+class RoomListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -205,9 +412,11 @@ class RoomListCreateView(generics.ListCreateAPIView):
         serializer.save()
 
 
-class RoomDetailView(generics.RetrieveUpdateDestroyAPIView):
+class RoomDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
 
     def get_permissions(self):
         if self.request.method == 'GET':
@@ -225,9 +434,11 @@ class RoomDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
-@method_decorator(cache_page(60 * 15, key_prefix='event_list'), name='list')
-class EventListCreateView(generics.ListCreateAPIView):
+@method_decorator(single_flight_cache_page(60 * 15, key_prefix='event_list'), name='list')
+class EventListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = EventSerializer
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
 
     def get_queryset(self):
         queryset = Event.objects.all().select_related('club', 'room')
@@ -252,79 +463,108 @@ class EventListCreateView(generics.ListCreateAPIView):
         if club_pk:
             club = Club.objects.get(pk=club_pk)
 
-            if not self.request.user.is_staff and not ClubMember.objects.filter(
-                    user=self.request.user,
-                    club=club,
-                    role=ClubMember.RoleChoices.HEAD
-            ).exists():
+            if not self.request.user.is_staff and not is_club_head(self.request.user, club.pk):
                 raise PermissionDenied("Only admin users or club heads can create events.")
 
             serializer.save(club=club)
         else:
             club = serializer.validated_data.get('club')
-            if not self.request.user.is_staff and not ClubMember.objects.filter(
-                    user=self.request.user,
-                    club=club,
-                    role=ClubMember.RoleChoices.HEAD
-            ).exists():
+            if not self.request.user.is_staff and not is_club_head(self.request.user, club and club.pk):
                 raise PermissionDenied("Only admin users or club heads can create events.")
 
             serializer.save()
 
 
-class EventDetailView(generics.RetrieveUpdateDestroyAPIView):
+class EventDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Event.objects.all().select_related('club', 'room')
     serializer_class = EventSerializer
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
 
     def get_permissions(self):
         if self.request.method == 'GET':
             return [permissions.AllowAny()]
         return [permissions.IsAdminUser(), IsAdminOrHeadOfThisClub()]
 
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        record_view(int(kwargs['pk']))
+
+        fields, omit = sparse_fieldset_params(request)
+        if (not fields or 'recommended' in fields) and 'recommended' not in omit:
+            response.data['recommended'] = self.recommended(int(kwargs['pk']))
+        return response
+
+    def recommended(self, event_id):
+        event_ids = recommended_event_ids(event_id)
+        if not event_ids:
+            return []
+        events = {event['id']: event for event in Event.objects.filter(
+            id__in=event_ids,
+            end_date__gte=timezone.now()
+        ).values('id', 'title', 'start_date')}
+        return [events[pk] for pk in event_ids if pk in events]
+
     def perform_update(self, serializer):
         instance = self.get_object()
-        if not self.request.user.is_staff and not ClubMember.objects.filter(
-                user=self.request.user,
-                club=instance.club,
-                role=ClubMember.RoleChoices.HEAD
-        ).exists():
+        if not self.request.user.is_staff and not is_club_head(self.request.user, instance.club_id):
             raise PermissionDenied("Only admin users or club heads can update events.")
 
         serializer.save()
 
     def perform_destroy(self, instance):
-        if not self.request.user.is_staff and not ClubMember.objects.filter(
-                user=self.request.user,
-                club=instance.club,
-                role=ClubMember.RoleChoices.HEAD
-        ).exists():
+        if not self.request.user.is_staff and not is_club_head(self.request.user, instance.club_id):
             raise PermissionDenied("Only admin users or club heads can delete events.")
 
         instance.delete()
 
 
-class TicketListCreateView(generics.ListCreateAPIView):
+class EventTrendingView(views.APIView):
+    """Events ranked by recent ticket sales, reviews and views, highest first."""
+    page_size = 20
+    max_page_size = 50
+    throttle_scope = {'GET': 'catalogue'}
+    read_from_replica = True
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', self.page_size)), self.max_page_size)
+        except ValueError:
+            limit = self.page_size
+        event_ids = trending_event_ids(max(limit, 1))
+
+        context = {'request': request}
+        # Events that ended since the last rebuild are skipped
+        queryset = Event.objects.filter(id__in=event_ids, end_date__gte=timezone.now()).select_related('club', 'room')
+        events = {event.id: event for event in EventSerializer.prune_queryset(queryset, context)}
+        serializer = EventSerializer([events[pk] for pk in event_ids if pk in events], many=True, context=context)
+        return Response(serializer.data)
+
+
+class TicketListCreateView(IdempotencyMixin, SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = TicketSerializer
+    throttle_scope = {'POST': 'ticket_purchase'}
+    read_from_replica = True
 
     def get_queryset(self):
         event_pk = self.kwargs.get('event_pk')
         if event_pk:
-            return Ticket.objects.filter(event_id=event_pk).select_related('event', 'student', 'event__club')
+            if not self.request.user.is_staff:
+                club_id = Event.objects.filter(pk=event_pk).values_list('club_id', flat=True).first()
+                if club_id not in request_head_club_ids(self.request):
+                    raise PermissionDenied("Only admins and the club head can list an event's tickets.")
+            return Ticket.objects.for_event(event_pk).select_related('event', 'student', 'event__club')
 
         if self.request.user.is_staff:
             return Ticket.objects.all().select_related('event', 'student', 'event__club')
 
-        # Cache head_clubs to avoid multiple DB hits
-        head_clubs = list(ClubMember.objects.filter(
-            user=self.request.user,
-            role=ClubMember.RoleChoices.HEAD
-        ).values_list('club_id', flat=True))
+        head_clubs = request_head_club_ids(self.request)
 
         # Cache club_events to avoid multiple DB hits
         club_events = list(Event.objects.filter(club_id__in=head_clubs).values_list('id', flat=True))
 
         return Ticket.objects.filter(
-            Q(student=self.request.user) | Q(event_id__in=club_events)
+            Q(student_id=self.request.user.id) | Q(event_id__in=club_events)
         ).select_related('event', 'student', 'event__club')
 
     def get_permissions(self):
@@ -349,41 +589,40 @@ class TicketListCreateView(generics.ListCreateAPIView):
             student.wallet_balance -= event.ticket_price
             student.save()
 
-        serializer.save(student=student)
+        try:
+            serializer.save(student=student)
+        except IntegrityError:
+            # A concurrent purchase won; leaving the atomic block rolls back the debit above
+            raise serializers.ValidationError({"student": "This student already has a ticket for this event."})
 
 
-class TicketDetailView(generics.RetrieveDestroyAPIView):
+class TicketDetailView(IdempotencyMixin, SparseFieldsViewMixin, generics.RetrieveDestroyAPIView):
     serializer_class = TicketSerializer
+    # Cancelling refunds the wallet
+    idempotent_methods = ('DELETE',)
 
     def get_queryset(self):
+        # Looked up by pk in every partition, so old tickets can still be read and cancelled
+        tickets = Ticket.objects.all()
+
         if self.request.user.is_staff:
-            return Ticket.objects.all().select_related('event', 'student', 'event__club')
+            return tickets.select_related('event', 'student', 'event__club')
 
-        # Cache head_clubs to avoid multiple DB hits
-        head_clubs = list(ClubMember.objects.filter(
-            user=self.request.user,
-            role=ClubMember.RoleChoices.HEAD
-        ).values_list('club_id', flat=True))
+        head_clubs = request_head_club_ids(self.request)
 
         # Cache club_events to avoid multiple DB hits
         club_events = list(Event.objects.filter(club_id__in=head_clubs).values_list('id', flat=True))
 
-        return Ticket.objects.filter(
-            Q(student=self.request.user) | Q(event_id__in=club_events)
+        return tickets.filter(
+            Q(student_id=self.request.user.id) | Q(event_id__in=club_events)
         ).select_related('event', 'student', 'event__club')
 
     def get_permissions(self):
         return [permissions.IsAuthenticated()]
 
     def perform_destroy(self, instance):
-        if instance.student != self.request.user and not self.request.user.is_staff:
-            is_club_head = ClubMember.objects.filter(
-                user=self.request.user,
-                club=instance.event.club,
-                role=ClubMember.RoleChoices.HEAD
-            ).exists()
-
-            if not is_club_head:
+        if instance.student_id != self.request.user.id and not self.request.user.is_staff:
+            if not is_club_head(self.request.user, instance.event.club_id):
                 raise PermissionDenied("You can only cancel your own tickets.")
 
         if instance.event.ticket_type == Event.TicketTypeChoices.PAID:
@@ -394,19 +633,85 @@ class TicketDetailView(generics.RetrieveDestroyAPIView):
         instance.delete()
 
 
-class StudentTicketsView(generics.ListAPIView):
+class EventCheckInView(APIView):
+    """
+    Records a batch of door scans for one event. Each scan carries a signed ticket
+    token; the first scan of a ticket checks it in and later ones, including retries
+    of the same batch, are reported as already checked in.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, event_pk):
+        event = Event.objects.only('id', 'club_id', 'start_date').filter(pk=event_pk).first()
+        if event is None:
+            raise NotFound("Event not found.")
+        if not request.user.is_staff and not is_club_head(request.user, event.club_id):
+            raise PermissionDenied("Only admins and the club head can check in tickets.")
+
+        serializer = CheckInBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        now = timezone.now()
+        results, scans = [], {}
+        for scan in serializer.validated_data['scans']:
+            try:
+                claims = verify_ticket_token(scan['token'])
+            except ExpiredTicketToken:
+                results.append({'status': 'expired'})
+                continue
+            except InvalidTicketToken:
+                results.append({'status': 'invalid'})
+                continue
+            result = {'ticket': claims.ticket_id}
+            results.append(result)
+            if claims.event_id != event.pk:
+                result['status'] = 'wrong_event'
+                continue
+            scanned_at = min(scan.get('scanned_at', now), now)
+            # The same ticket scanned twice in one batch keeps its first scan
+            scans[claims.ticket_id] = min(scanned_at, scans.get(claims.ticket_id, scanned_at))
+
+        tickets = set(Ticket.objects.for_event(event).filter(pk__in=scans).values_list('pk', flat=True))
+        previous = dict(CheckIn.objects.filter(ticket_id__in=tickets).values_list('ticket_id', 'scanned_at'))
+        new = {pk: scanned_at for pk, scanned_at in scans.items() if pk in tickets and pk not in previous}
+        CheckIn.objects.bulk_create([
+            CheckIn(ticket_id=pk, event_id=event.pk, scanned_at=scanned_at, scanned_by_id=request.user.id)
+            for pk, scanned_at in new.items()
+        ], ignore_conflicts=True)
+
+        reported = set()
+        for result in results:
+            if 'status' in result:
+                continue
+            pk = result['ticket']
+            if pk not in tickets:
+                # Cancelled after the token was issued
+                result['status'] = 'not_found'
+            elif pk in new and pk not in reported:
+                result['status'] = 'checked_in'
+                result['scanned_at'] = new[pk]
+                reported.add(pk)
+            else:
+                result['status'] = 'already_checked_in'
+                result['scanned_at'] = previous.get(pk, new.get(pk))
+
+        return Response({'checked_in': len(new), 'results': results})
+
+
+class StudentTicketsView(SparseFieldsViewMixin, generics.ListAPIView):
+    """
+    Tickets of a student to events of the last TICKET_HOT_TERMS terms and later, which
+    keeps the read to the current ticket partitions. ?archived=true lists older ones too.
+    """
     serializer_class = TicketSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
 
     def get_queryset(self):
         student_pk = self.kwargs.get('student_pk', self.request.user.id)
 
         if student_pk != self.request.user.id and not self.request.user.is_staff:
-            # Cache head_clubs to avoid multiple DB hits
-            head_clubs = list(ClubMember.objects.filter(
-                user=self.request.user,
-                role=ClubMember.RoleChoices.HEAD
-            ).values_list('club_id', flat=True))
+            head_clubs = request_head_club_ids(self.request)
 
             if not head_clubs:
                 raise PermissionDenied("You can only view your own tickets.")
@@ -419,12 +724,16 @@ class StudentTicketsView(generics.ListAPIView):
             if not student_clubs:
                 raise PermissionDenied("You can only view tickets for members of clubs you head.")
 
-        return Ticket.objects.filter(student_id=student_pk).select_related('event', 'student', 'event__club')
+        tickets = student_tickets(student_pk)
+        if self.request.query_params.get('archived') != 'true':
+            tickets = tickets.hot()
+        return tickets
 
 
-class SubscriptionListCreateView(generics.ListCreateAPIView):
+class SubscriptionListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = SubscriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
 
     def get_queryset(self):
         club_pk = self.kwargs.get('club_pk')
@@ -433,9 +742,9 @@ class SubscriptionListCreateView(generics.ListCreateAPIView):
 
         user_pk = self.kwargs.get('user_pk')
         if user_pk:
-            return Subscription.objects.filter(user_id=user_pk).select_related('user', 'club')
+            return user_subscriptions(user_pk)
 
-        return Subscription.objects.filter(user=self.request.user).select_related('user', 'club')
+        return user_subscriptions(self.request.user.id)
 
     def perform_create(self, serializer):
         user = serializer.validated_data.get('user', self.request.user)
@@ -451,24 +760,38 @@ class SubscriptionListCreateView(generics.ListCreateAPIView):
             serializer.save(user=user)
 
 
-class SubscriptionDetailView(generics.RetrieveDestroyAPIView):
+class SubscriptionDetailView(SparseFieldsViewMixin, generics.RetrieveDestroyAPIView):
     serializer_class = SubscriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return Subscription.objects.all().select_related('user', 'club')
-        return Subscription.objects.filter(user=self.request.user).select_related('user', 'club')
+        return Subscription.objects.filter(user_id=self.request.user.id).select_related('user', 'club')
 
     def perform_destroy(self, instance):
-        if instance.user != self.request.user and not self.request.user.is_staff:
+        if instance.user_id != self.request.user.id and not self.request.user.is_staff:
             raise PermissionDenied("You can only unsubscribe yourself.")
         instance.delete()
 
 
-class EventReviewListCreateView(generics.ListCreateAPIView):
+class SubscriptionBulkView(ClubUsersBulkView):
+    model = Subscription
+    permission_classes = [permissions.IsAdminUser]
+
+    def after_create(self, club_pk, user_ids):
+        super().after_create(club_pk, user_ids)
+        transaction.on_commit(lambda: backfill_subscriptions(user_ids, club_pk))
+
+    def after_delete(self, club_pk, user_ids):
+        super().after_delete(club_pk, user_ids)
+        transaction.on_commit(lambda: remove_subscriptions(user_ids, club_pk))
+
+
+class EventReviewListCreateView(SparseFieldsViewMixin, generics.ListCreateAPIView):
     serializer_class = EventReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    read_from_replica = True
 
     def get_queryset(self):
         event_pk = self.kwargs.get('event_pk')
@@ -480,8 +803,8 @@ class EventReviewListCreateView(generics.ListCreateAPIView):
 
         # Optimize the complex query with select_related
         return EventReview.objects.filter(
-            Q(user=self.request.user) | Q(event__club__members__user=self.request.user,
-                                          event__club__members__role=ClubMember.RoleChoices.HEAD)
+            Q(user_id=self.request.user.id) | Q(event__club__members__user_id=self.request.user.id,
+                                                event__club__members__role=ClubMember.RoleChoices.HEAD)
         ).select_related('user', 'event', 'event__club').distinct()
 
     def perform_create(self, serializer):
@@ -495,7 +818,7 @@ class EventReviewListCreateView(generics.ListCreateAPIView):
         if event_pk:
             event = Event.objects.get(pk=event_pk)
 
-            if not Ticket.objects.filter(event=event, student=user).exists():
+            if not Ticket.objects.for_event(event).filter(student=user).exists():
                 raise serializers.ValidationError(
                     {"event": "You can only review events you have tickets for."}
                 )
@@ -505,7 +828,7 @@ class EventReviewListCreateView(generics.ListCreateAPIView):
             serializer.save(user=user)
 
 
-class EventReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
+class EventReviewDetailView(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = EventReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -515,27 +838,21 @@ class EventReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
 
         # Optimize the complex query with select_related
         return EventReview.objects.filter(
-            Q(user=self.request.user) | Q(event__club__members__user=self.request.user,
-                                          event__club__members__role=ClubMember.RoleChoices.HEAD)
+            Q(user_id=self.request.user.id) | Q(event__club__members__user_id=self.request.user.id,
+                                                event__club__members__role=ClubMember.RoleChoices.HEAD)
         ).select_related('user', 'event', 'event__club').distinct()
 
     def perform_update(self, serializer):
         instance = self.get_object()
 
-        if instance.user != self.request.user and not self.request.user.is_staff:
+        if instance.user_id != self.request.user.id and not self.request.user.is_staff:
             raise PermissionDenied("You can only update your own reviews.")
 
         serializer.save()
 
     def perform_destroy(self, instance):
-        if instance.user != self.request.user and not self.request.user.is_staff:
-            is_club_head = ClubMember.objects.filter(
-                user=self.request.user,
-                club=instance.event.club,
-                role=ClubMember.RoleChoices.HEAD
-            ).exists()
-
-            if not is_club_head:
+        if instance.user_id != self.request.user.id and not self.request.user.is_staff:
+            if not is_club_head(self.request.user, instance.event.club_id):
                 raise PermissionDenied("You cannot delete this review.")
 
         instance.delete()
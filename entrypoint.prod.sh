@@ -3,4 +3,8 @@
 python manage.py collectstatic --noinput
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
+# Per-worker metric files are aggregated by /metrics; start from a clean directory
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 python -m gunicorn --bind 0.0.0.0:8000 --workers 3 sxodimsdu.wsgi:application
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from core.metrics import metrics_view
 from core.views import VerifyEmailAPIView
 from . import settings
 from django.conf.urls.static import static
@@ -20,6 +21,7 @@ urlpatterns = [
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('silk/', include('silk.urls', namespace='silk')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG: